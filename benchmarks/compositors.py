@@ -0,0 +1,70 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath("src")))
+
+from compositing import COMPOSITORS, supported_compositors  # noqa: E402
+from marker import Marker  # noqa: E402
+from synthetic import create_image  # noqa: E402
+from watermark_cache import WatermarkCache  # noqa: E402
+
+
+def create_overlay(image: Image.Image, watermark_cache: WatermarkCache, watermark_path: str) -> tuple:
+    watermark = watermark_cache.get_source(watermark_path)
+    layout = Marker._get_layout(image.size, watermark.size, 40, 20, "benchmark")
+    return watermark_cache.get_overlay(watermark_path, layout), layout.overlay_position
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check that all compositors give the same pixels and time them.")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--watermark", default=None, help="Watermark to use instead of a generated one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        watermark_path = args.watermark
+        if watermark_path is None:
+            # Every alpha value appears in the watermark, so the blend is compared for all of them
+            watermark = Image.new("RGBA", (600, 120), (0, 0, 0, 0))
+            draw = ImageDraw.Draw(watermark)
+            for x in range(0, 600, 4):
+                draw.line((x, 0, x, 119), fill=(255, x % 256, 255 - x % 256, x * 255 // 600))
+            watermark_path = str(Path(temp_dir).joinpath("watermark.png"))
+            watermark.save(watermark_path)
+        return compare_compositors(watermark_path, (args.width, args.height), args.repeats)
+
+
+def compare_compositors(watermark_path: str, size: tuple[int, int], repeats: int) -> int:
+    watermark_cache = WatermarkCache()
+    compositors = supported_compositors()
+    mismatches = 0
+    for mode in ["RGB", "RGBA", "L"]:
+        source = create_image(size, mode)
+        overlay, position = create_overlay(source, watermark_cache, watermark_path)
+        reference = None
+        for name in compositors:
+            image = source.copy()
+            COMPOSITORS[name](image, overlay, position)
+            if reference is None:
+                reference = image
+            elif ImageChops.difference(reference, image).getbbox() is not None:
+                print(f"{mode:>4} {name:>6}: pixels differ from {compositors[0]}", file=sys.stderr)
+                mismatches += 1
+
+            start = time.perf_counter()
+            for _ in range(repeats):
+                COMPOSITORS[name](source.copy(), overlay, position)
+            seconds = (time.perf_counter() - start) / repeats
+            print(f"{mode:>4} {name:>6}: {seconds * 1000:8.2f} ms per image")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
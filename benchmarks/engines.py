@@ -0,0 +1,54 @@
+import argparse
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath("src")))
+
+from marker import Marker, MarkerState  # noqa: E402
+from synthetic import create_images, create_watermark  # noqa: E402
+
+
+def run_engine(engine: str, images: list[str], watermark_path: str, output_folder: Path, max_workers: int) -> float:
+    marker = Marker(logging.getLogger("watermarker.benchmark"), max_workers=max_workers, engine=engine)
+    marker.images = images
+    marker.watermark_path = watermark_path
+    marker.output_folder = str(output_folder)
+    marker.padding_around_watermarks = 40
+    marker.padding_between_watermarks = 20
+
+    start = time.perf_counter()
+    marker.set_state("run")
+    while marker.state != MarkerState.IDLE:
+        time.sleep(0.01)
+    seconds = time.perf_counter() - start
+    marker.shutdown(wait=True)
+    return seconds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the execution engines of Marker.")
+    parser.add_argument("--images", type=int, default=40)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--workers", type=int, default=Marker.__init__.__defaults__[0])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        source_folder = temp_path.joinpath("source")
+        source_folder.mkdir()
+        images = create_images(source_folder, args.images, (args.width, args.height))
+        watermark_path = create_watermark(temp_path)
+
+        for engine in ["thread", "process", "pipeline"]:
+            output_folder = temp_path.joinpath(f"output_{engine}")
+            output_folder.mkdir()
+            seconds = run_engine(engine, images, watermark_path, output_folder, args.workers)
+            print(f"{engine:>8}: {seconds:7.2f} s, {len(images) / seconds:6.2f} images/s ({args.workers} workers)")
+
+
+if __name__ == "__main__":
+    main()
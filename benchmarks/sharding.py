@@ -0,0 +1,72 @@
+import argparse
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath("src")))
+
+from synthetic import create_images, create_watermark  # noqa: E402
+
+CLI_PATH = Path(__file__).resolve().parent.parent.joinpath("src", "cli.py")
+FINISHED_PATTERN = re.compile(r"Finished, (\d+) of \d+ images marked")
+
+
+def run_processes(
+        source_folder: Path,
+        watermark_path: str,
+        output_folder: Path,
+        processes: int,
+        workers: int,
+        mode: str) -> tuple[float, list[int]]:
+    commands = [[sys.executable, str(CLI_PATH), str(source_folder), "-w", watermark_path, "-o", str(output_folder),
+                 "--padding-around", "40", "--padding-between", "20", "-j", str(workers), "--interval", "3600"]
+                + (["--shard", f"{index}/{processes}"] if mode == "shard" else ["--work-stealing"])
+                for index in range(1, processes + 1)]
+
+    start = time.perf_counter()
+    running = [subprocess.Popen(command, stdout=subprocess.PIPE, text=True) for command in commands]
+    outputs = [process.communicate()[0] for process in running]
+    seconds = time.perf_counter() - start
+    if any(process.returncode for process in running):
+        raise RuntimeError(f"A process of the {mode} run failed:\n{''.join(outputs)}")
+    return seconds, [int(match.group(1)) for output in outputs for match in FINISHED_PATTERN.finditer(output)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Split one run over several processes, like over several machines sharing the folders, and check "
+                    "that every image is marked exactly once."
+    )
+    parser.add_argument("--images", type=int, default=40)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=2, help="Workers per process")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        source_folder = temp_path.joinpath("source")
+        source_folder.mkdir()
+        images = create_images(source_folder, args.images, (args.width, args.height))
+        watermark_path = create_watermark(temp_path)
+
+        failed = False
+        for mode in ["shard", "work-stealing"]:
+            output_folder = temp_path.joinpath(f"output_{mode}")
+            seconds, marked_per_process = run_processes(
+                source_folder, watermark_path, output_folder, args.processes, args.workers, mode
+            )
+            marked_images = len([path for path in output_folder.iterdir() if not path.name.startswith(".")])
+            ok = sum(marked_per_process) == marked_images == len(images)
+            failed = failed or not ok
+            print(f"{mode:>13}: {seconds:7.2f} s, {len(images) / seconds:6.2f} images/s, marked per process "
+                  f"{marked_per_process}, {marked_images} of {len(images)} outputs {'ok' if ok else 'MISMATCH'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
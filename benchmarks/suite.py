@@ -0,0 +1,228 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import PIL
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath("src")))
+
+from marker import Marker, MarkerState  # noqa: E402
+from renditions import RenditionOutput  # noqa: E402
+from synthetic import create_images, create_watermark  # noqa: E402
+from watermark_cache import WatermarkCache  # noqa: E402
+
+RESULTS_VERSION = 1
+
+IMAGE_SIZES = {
+    "2mp": (1600, 1200),
+    "12mp": (4000, 3000),
+    "24mp": (6000, 4000),
+    "50mp": (8660, 5773)
+}
+
+
+@dataclass(frozen=True)
+class Case:
+    name: str
+    size: tuple[int, int]
+    mode: str
+    image_format: str
+
+
+def get_cases(size_names: list[str]) -> list[Case]:
+    cases = []
+    for size_name in size_names:
+        width, height = IMAGE_SIZES[size_name]
+        cases.append(Case(f"{size_name}-landscape-jpeg-rgb", (width, height), "RGB", "JPEG"))
+        cases.append(Case(f"{size_name}-portrait-jpeg-rgb", (height, width), "RGB", "JPEG"))
+        cases.append(Case(f"{size_name}-landscape-png-rgba", (width, height), "RGBA", "PNG"))
+    return cases
+
+
+def measure(function: Callable[[], None], repeats: int) -> float:
+    # The first call warms caches the same way the first image of a run does
+    function()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def benchmark_functions(case: Case, folder: Path, watermark_path: str, repeats: int) -> dict[str, float]:
+    image_path = create_images(folder, 1, case.size, case.mode, case.image_format)[0]
+    marked_image_path = str(folder.joinpath("marked", Path(image_path).name))
+    watermark_cache = WatermarkCache()
+
+    def get_marked_image() -> None:
+        Marker._get_marked_image(image_path, watermark_path, 40, 20, watermark_cache).close()
+
+    def place_mark_and_save() -> None:
+        _, _, error, _ = Marker._place_mark_and_save(
+            image_path, [RenditionOutput(marked_image_path, None, "default", watermark_path, 40, 20)], watermark_cache
+        )
+        if error:
+            raise RuntimeError(error)
+
+    with Image.open(image_path) as preview_image:
+        preview_image.thumbnail((800, 800))
+
+        def convert_to_base64() -> None:
+            Marker.convert_to_base64(preview_image)
+
+        return {
+            f"get_marked_image/{case.name}": measure(get_marked_image, repeats),
+            f"place_mark_and_save/{case.name}": measure(place_mark_and_save, repeats),
+            f"convert_to_base64/{case.name}": measure(convert_to_base64, repeats)
+        }
+
+
+def benchmark_run(images: list[str], watermark_path: str, folder: Path, max_workers: int, engine: str) -> float:
+    marker = Marker(logging.getLogger("watermarker.benchmark"), max_workers=max_workers, engine=engine)
+    marker.images = images
+    marker.watermark_path = watermark_path
+    marker.output_folder = str(folder)
+    marker.padding_around_watermarks = 40
+    marker.padding_between_watermarks = 20
+
+    start = time.perf_counter()
+    marker.set_state("run")
+    while marker.state != MarkerState.IDLE:
+        time.sleep(0.005)
+    seconds = time.perf_counter() - start
+    marker.shutdown(wait=True)
+    if failed := marker.progress().failed:
+        raise RuntimeError(f"{failed} images failed in the benchmark run")
+    return seconds
+
+
+def run_benchmarks(args: argparse.Namespace) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        watermark_path = create_watermark(temp_path)
+
+        for case in get_cases(args.sizes):
+            print(f"Measuring {case.name}...", file=sys.stderr)
+            results.update(benchmark_functions(case, temp_path, watermark_path, args.repeats))
+
+        run_folder = temp_path.joinpath("run")
+        run_folder.mkdir()
+        run_size = IMAGE_SIZES[args.run_size]
+        images = create_images(run_folder, args.run_images // 2, run_size)
+        images += create_images(run_folder, args.run_images - len(images), run_size[::-1], "RGB", "PNG")
+        for max_workers in args.workers:
+            print(f"Measuring a run with {max_workers} workers...", file=sys.stderr)
+            timings = []
+            for repeat in range(args.run_repeats):
+                output_folder = temp_path.joinpath(f"output_{max_workers}_{repeat}")
+                output_folder.mkdir()
+                timings.append(benchmark_run(images, watermark_path, output_folder, max_workers, args.engine))
+            results[f"run/{args.engine}/{max_workers}-workers"] = statistics.median(timings)
+
+    return {
+        "version": RESULTS_VERSION,
+        "environment": {
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count()
+        },
+        "settings": {
+            "sizes": args.sizes,
+            "repeats": args.repeats,
+            "run_images": args.run_images,
+            "run_size": args.run_size,
+            "engine": args.engine
+        },
+        "seconds": results
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    if baseline.get("environment") != results["environment"]:
+        print("Warning: the baseline was measured in a different environment", file=sys.stderr)
+
+    regressions = []
+    for name, seconds in results["seconds"].items():
+        if name not in baseline["seconds"]:
+            print(f"{name:<48} {seconds * 1000:10.2f} ms  (new)")
+            continue
+        baseline_seconds = baseline["seconds"][name]
+        change = seconds / baseline_seconds - 1
+        regressed = change > threshold
+        print(f"{name:<48} {seconds * 1000:10.2f} ms  {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Measure the marking pipeline on synthetic images and compare the results against a baseline."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: value.split(","),
+        default=["2mp", "12mp"],
+        help=f"Comma separated image sizes out of {', '.join(IMAGE_SIZES)}"
+    )
+    parser.add_argument("--repeats", type=int, default=5, help="Measurements per function, the median is kept")
+    parser.add_argument("--run-images", type=int, default=24, help="Images marked in every full run")
+    parser.add_argument("--run-size", choices=list(IMAGE_SIZES), default="12mp", help="Image size of the full runs")
+    parser.add_argument("--run-repeats", type=int, default=3, help="Full runs per worker count, the median is kept")
+    parser.add_argument(
+        "--workers",
+        type=lambda value: [int(workers) for workers in value.split(",")],
+        default=sorted({1, 2, 4, max(1, os.cpu_count() - 2)}),
+        help="Comma separated worker counts for the full runs"
+    )
+    parser.add_argument("--engine", choices=["thread", "process", "pipeline"], default="thread")
+    parser.add_argument("-o", "--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier measurement to compare against")
+    parser.add_argument(
+        "--threshold", type=float, default=0.15, help="Allowed slowdown against the baseline, 0.15 is 15 %%"
+    )
+    args = parser.parse_args(argv)
+    if unknown_sizes := [size for size in args.sizes if size not in IMAGE_SIZES]:
+        parser.error(f"Unknown image sizes: {', '.join(unknown_sizes)}")
+    return args
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    results = run_benchmarks(args)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    if not args.baseline:
+        for name, seconds in results["seconds"].items():
+            print(f"{name:<48} {seconds * 1000:10.2f} ms")
+        return 0
+
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+    if baseline.get("version") != RESULTS_VERSION:
+        print(f"Unsupported baseline version {baseline.get('version')}", file=sys.stderr)
+        return 2
+    if regressions := compare(results, baseline, args.threshold):
+        print(f"{len(regressions)} benchmark{'s' if len(regressions) > 1 else ''} regressed by more than "
+              f"{args.threshold:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
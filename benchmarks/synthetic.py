@@ -0,0 +1,34 @@
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+
+def create_image(size: tuple[int, int], mode: str = "RGB", seed: int = 0) -> Image.Image:
+    image = Image.linear_gradient("L").resize(size).convert(mode)
+    draw = ImageDraw.Draw(image)
+    fill = (seed * 37 % 256, 120, 180, 255)[:len(mode)]
+    draw.ellipse((0, 0, size[0] - 1, size[1] - 1), fill=fill if len(fill) > 1 else fill[0])
+    for line in range(0, size[0], max(1, size[0] // 64)):
+        draw.line((line, 0, size[0] - line, size[1] - 1), fill=(220, seed * 53 % 256, 40, 200)[:len(mode)], width=3)
+    return image
+
+
+def create_images(
+        folder: Path, amount: int, size: tuple[int, int], mode: str = "RGB", image_format: str = "JPEG") -> list[str]:
+    suffix = ".jpg" if image_format == "JPEG" else f".{image_format.lower()}"
+    images = []
+    for index in range(amount):
+        image_path = folder.joinpath(f"image_{size[0]}x{size[1]}_{mode}_{index:04}{suffix}")
+        create_image(size, mode, index).save(image_path, image_format, **({"quality": 90} if suffix == ".jpg" else {}))
+        images.append(str(image_path))
+    return images
+
+
+def create_watermark(folder: Path, size: tuple[int, int] = (600, 120)) -> str:
+    watermark = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(watermark)
+    draw.rectangle((10, 10, size[0] - 10, size[1] - 10), fill=(255, 255, 255, 128))
+    draw.text((size[0] // 4, size[1] // 3), "watermarker", fill=(0, 0, 0, 255))
+    watermark_path = folder.joinpath(f"watermark_{size[0]}x{size[1]}.png")
+    watermark.save(watermark_path)
+    return str(watermark_path)
@@ -8,7 +8,8 @@ from flet.core.page import Page
 from controls.marker_run import MarkerRun
 from controls.preview import Preview
 from controls.user_input import UserInput
-from marker import Marker, MarkerState
+from encoder_profiles import ENCODER_PROFILES, supported_output_formats
+from marker import Marker, MarkerState, StateChangeError
 
 
 class MarkerApp:
@@ -58,6 +59,10 @@ class MarkerApp:
         self._load_output_folder_path()
         self._load_name_extension()
         self._load_padding()
+        self._load_encoding()
+        self._load_recursive()
+        self._load_incremental()
+        self._load_memory_limit()
         progress = self._load_progress()
         if progress:
             self._preview.update_preview()
@@ -67,6 +72,7 @@ class MarkerApp:
     def _load_images_paths(self) -> None:
         if images := self._page.client_storage.get("watermarker.images"):
             self._marker.images = [image for image in images if Path(image).exists()]
+            self._marker.source_folder = self._page.client_storage.get("watermarker.source_folder")
             if self._marker.images:
                 self._user_input.set_images_text()
 
@@ -99,7 +105,46 @@ class MarkerApp:
             self._user_input.padding_between_text_field.value = str(padding_between)
             self._user_input.padding_between_text_field.update()
 
+    def _load_encoding(self) -> None:
+        if (encoder_profile := self._page.client_storage.get("watermarker.encoder_profile")) in ENCODER_PROFILES:
+            self._marker.encoder_profile = encoder_profile
+            self._user_input.encoder_profile_dropdown.value = encoder_profile
+            self._user_input.encoder_profile_dropdown.update()
+
+        if (output_format := self._page.client_storage.get("watermarker.output_format")) in supported_output_formats():
+            self._marker.output_format = output_format
+            self._user_input.output_format_dropdown.value = output_format
+            self._user_input.output_format_dropdown.update()
+
+    def _load_recursive(self) -> None:
+        if (recursive := self._page.client_storage.get("watermarker.recursive")) is not None:
+            self._marker.recursive = recursive
+            self._user_input.recursive_checkbox.value = recursive
+            self._user_input.recursive_checkbox.update()
+
+    def _load_incremental(self) -> None:
+        if incremental := self._page.client_storage.get("watermarker.incremental"):
+            self._marker.incremental = incremental
+            self._user_input.incremental_checkbox.value = incremental
+            self._user_input.incremental_checkbox.update()
+
+    def _load_memory_limit(self) -> None:
+        if memory_limit := self._page.client_storage.get("watermarker.memory_limit"):
+            self._marker.memory_limit = int(memory_limit * 1024 ** 3)
+            self._user_input.memory_limit_text_field.value = str(memory_limit)
+            self._user_input.memory_limit_text_field.update()
+
     def _load_progress(self) -> bool:
+        try:
+            resumed = self._marker.resume_from_journal()
+        except StateChangeError as e:
+            # The settings changed since, the next run starts over and replaces the saved progress
+            self._logger.error(e)
+            resumed = False
+        if resumed:
+            self._marker_run.paused()
+            return True
+        # Progress saved by older versions, before the journal existed
         if (images_todo := self._page.client_storage.get("watermarker.images_todo")) and (
                 images_done := self._page.client_storage.get("watermarker.images_done")):
             self._marker.resume_after_holiday(images_todo, images_done)
@@ -138,7 +183,7 @@ class MarkerApp:
                         content=ft.Text("Do you want to save the progress to continue next time?"),
                         actions=[ft.TextButton(
                             "Yes", on_click=lambda _: self._save_and_exit(paused_alert)
-                        ), ft.TextButton("No", on_click=lambda _: self._page.window.destroy()), ft.TextButton(
+                        ), ft.TextButton("No", on_click=lambda _: self._discard_and_exit()), ft.TextButton(
                             "Don't exit", on_click=lambda _: self._page.close(paused_alert)
                         )]
                     )
@@ -157,7 +202,7 @@ class MarkerApp:
                 case MarkerState.CANCELING:
                     self._wait_and_exit(MarkerState.CANCELING)
                 case _:
-                    self._page.window.destroy()
+                    self._exit()
 
     def _save_and_exit(self, alert: ft.AlertDialog | None = None) -> None:
         self._page.close(alert)
@@ -165,17 +210,24 @@ class MarkerApp:
             self._marker_run.pause()
         while self._marker.state == MarkerState.PAUSING:
             sleep(0.1)
-        self._page.client_storage.set("watermarker.images_todo", self._marker.images_todo)
-        self._page.client_storage.set("watermarker.images_done", self._marker.images_done)
-        self._page.window.destroy()
+        self._exit()
 
     def _cancel_and_exit(self, alert: ft.AlertDialog | None = None) -> None:
         self._marker_run.cancel(alert)
-        self._page.window.destroy()
+        self._exit()
 
     def _wait_and_exit(self, state: MarkerState) -> None:
         while self._marker.state == state:
             sleep(0.1)
+        self._discard_and_exit()
+
+    def _discard_and_exit(self) -> None:
+        if self._marker.state == MarkerState.PAUSED:
+            self._marker.set_state("cancel")
+        self._exit()
+
+    def _exit(self) -> None:
+        self._marker.shutdown()
         self._page.window.destroy()
 
     def _error(self) -> None:
@@ -0,0 +1,380 @@
+import argparse
+import logging
+import math
+import os
+import shutil
+import signal
+import sys
+import time
+from pathlib import Path
+
+from compositing import supported_compositors
+from encoder_profiles import ENCODER_PROFILES, supported_output_formats
+from governor import parse_memory_size
+from marker import Marker, MarkerProgress, MarkerState, StateChangeError, supported_image_extensions
+from pipeline import PIPELINE_STAGES
+from profiling import PROFILING_ENVIRONMENT_VARIABLE, PROFILING_MODES, parse_profiling_modes
+from renditions import Rendition, parse_rendition
+from run_stats import RunStatistics
+from sharding import parse_shard
+from watermark_jobs import WatermarkJob, parse_watermark_job
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+JOURNAL_FILE_NAME = ".watermarker-journal"
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="watermarker", description="Place a watermark on images without starting the GUI."
+    )
+    parser.add_argument("images", nargs="+", help="Image files and/or folders containing images")
+    parser.add_argument(
+        "--no-recursive", dest="recursive", action="store_false", help="Don't look for images in sub folders"
+    )
+    parser.add_argument(
+        "--extensions",
+        type=lambda value: [f".{extension.lower().lstrip('.')}" for extension in value.split(",")],
+        default=supported_image_extensions(),
+        help="Comma separated image file extensions to look for in folders"
+    )
+    parser.add_argument("-w", "--watermark", help="Path to the watermark image")
+    parser.add_argument("-o", "--output", help="Output folder for the marked images")
+    parser.add_argument(
+        "--job",
+        dest="jobs",
+        type=watermark_job,
+        action="append",
+        default=[],
+        metavar="KEY=VALUE,...",
+        help="Watermark job instead of -w and -o, repeat it to mark the images for several watermarks from one decode "
+             "of every image, e.g. watermark=client_a.png,output=out/client_a,around=40,between=20"
+    )
+    parser.add_argument("-n", "--name-extension", default="", help="Added to the name of every output image")
+    parser.add_argument(
+        "--encoder-profile", choices=list(ENCODER_PROFILES), default="default", help="Encoder settings for the output"
+    )
+    parser.add_argument(
+        "--output-format", choices=supported_output_formats(), default="keep", help="Convert the output to this format"
+    )
+    parser.add_argument(
+        "--rendition",
+        dest="renditions",
+        type=rendition,
+        action="append",
+        default=[],
+        metavar="KEY=VALUE,...",
+        help="Output rendition, repeat it to write several sizes or formats from one decode of every image, e.g. "
+             "max=2048,format=webp,profile=small,suffix=_web,folder=web; unset keys use the options above"
+    )
+    parser.add_argument("--padding-around", type=non_negative_int, default=0, help="Padding around watermarks in pixels")
+    parser.add_argument("--padding-between", type=non_negative_int, default=0, help="Padding between watermarks in pixels")
+    parser.add_argument(
+        "-j", "--workers", type=positive_int, default=max(1, os.cpu_count() - 2), help="Number of parallel workers"
+    )
+    parser.add_argument(
+        "--engine", choices=["thread", "process", "pipeline"], default="thread", help="Execution engine"
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=memory_size,
+        default=None,
+        help="Mark fewer images at once to stay below this much memory, e.g. 8G"
+    )
+    parser.add_argument(
+        "--max-megapixels",
+        type=non_negative_float,
+        default=None,
+        help="Refuse images above this size as possible decompression bombs, 0 for no limit, defaults to Pillow's"
+    )
+    parser.add_argument(
+        "--compositor", choices=supported_compositors(), default="pillow", help="Backend blending the watermark in"
+    )
+    parser.add_argument(
+        "--stage-workers",
+        type=parse_stage_workers,
+        default={},
+        help="Workers per stage of the pipeline engine, e.g. read=2,compose=6,encode=6,write=4"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true", help="Skip images already marked with the same settings"
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="Discard saved progress in the output folder and mark all images again"
+    )
+    parser.add_argument(
+        "--shard",
+        type=shard,
+        default=None,
+        metavar="INDEX/COUNT",
+        help="Mark only this share of the images, e.g. 2/4 on the second of four machines with the same command"
+    )
+    parser.add_argument(
+        "--work-stealing",
+        action="store_true",
+        help="Claim every image in the output folder before marking it, so several processes or machines running the "
+             "same command share the work; running it again continues, --restart forgets the claims"
+    )
+    parser.add_argument(
+        "--claim-timeout",
+        type=positive_float,
+        default=600.0,
+        help="Seconds after which an unfinished claim of a crashed process is taken over"
+    )
+    parser.add_argument("--interval", type=positive_float, default=1.0, help="Seconds between progress lines")
+    parser.add_argument(
+        "--profile",
+        type=profiling_modes,
+        default=os.environ.get(PROFILING_ENVIRONMENT_VARIABLE, ""),
+        help=f"Profile the run: {', '.join(PROFILING_MODES)} or all, defaults to ${PROFILING_ENVIRONMENT_VARIABLE}"
+    )
+    parser.add_argument("--profile-folder", default=".", help="Folder for the profiling results")
+    parser.add_argument(
+        "--stats", action="store_true", help="Print the time spent per stage after the run, e.g. to spot slow disks"
+    )
+    args = parser.parse_args(argv)
+    if not args.jobs and not (args.watermark and args.output):
+        parser.error("the following arguments are required: -w/--watermark and -o/--output, or --job")
+    if args.jobs and (args.watermark or args.output):
+        parser.error("--job can't be combined with -w/--watermark or -o/--output")
+    return args
+
+
+def positive_int(value: str) -> int:
+    if not value.isdigit() or int(value) < 1:
+        raise argparse.ArgumentTypeError(f"Expected a whole number of at least 1, got '{value}'")
+    return int(value)
+
+
+def non_negative_int(value: str) -> int:
+    if not value.isdigit():
+        raise argparse.ArgumentTypeError(f"Expected a whole number of at least 0, got '{value}'")
+    return int(value)
+
+
+def positive_float(value: str) -> float:
+    try:
+        number = float(value)
+    except ValueError:
+        number = math.nan
+    # Also refuses nan, which fails every comparison
+    if not number > 0 or math.isinf(number):
+        raise argparse.ArgumentTypeError(f"Expected a number above 0, got '{value}'")
+    return number
+
+
+def non_negative_float(value: str) -> float:
+    try:
+        number = float(value)
+    except ValueError:
+        number = math.nan
+    if not number >= 0 or math.isinf(number):
+        raise argparse.ArgumentTypeError(f"Expected a number of at least 0, got '{value}'")
+    return number
+
+
+def parse_stage_workers(value: str) -> dict[str, int]:
+    stage_workers = {}
+    for item in value.split(","):
+        stage, _, workers = item.partition("=")
+        if stage not in PIPELINE_STAGES or not workers.isdigit() or int(workers) < 1:
+            raise argparse.ArgumentTypeError(
+                f"Expected stage=workers with a stage out of {', '.join(PIPELINE_STAGES)}, got '{item}'"
+            )
+        stage_workers[stage] = int(workers)
+    return stage_workers
+
+
+def memory_size(value: str) -> int:
+    try:
+        return parse_memory_size(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected a size like 512M or 8G, got '{value}'")
+
+
+def rendition(value: str) -> Rendition:
+    try:
+        return parse_rendition(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def watermark_job(value: str) -> WatermarkJob:
+    try:
+        return parse_watermark_job(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def shard(value: str) -> tuple[int, int]:
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def profiling_modes(value: str) -> list[str]:
+    try:
+        return parse_profiling_modes(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def collect_images(paths: list[str], recursive: bool, extensions: list[str], exclude: list[str]) -> list[str]:
+    images = []
+    for path in map(os.path.abspath, paths):
+        if Path(path).is_dir():
+            images.extend(Marker.iter_images(
+                path, recursive, extensions, exclude, lambda error: print(f"Skipping {error}", file=sys.stderr)
+            ))
+        elif Path(path).is_file():
+            images.append(path)
+        else:
+            raise FileNotFoundError(f"No such file or folder: {path}")
+    return images
+
+
+def format_progress(progress: MarkerProgress, run_statistics: RunStatistics) -> str:
+    width = len(str(progress.total))
+    eta = f"{run_statistics.eta:.0f} s" if run_statistics.eta is not None else "-"
+    return (f"{progress.done:{width}}/{progress.total}{'+' if progress.discovering else ''} images, "
+            f"{progress.failed} failed, "
+            f"{f'{progress.skipped} claimed by others, ' if progress.skipped else ''}"
+            f"{run_statistics.images_per_second:.2f} images/s, "
+            f"{run_statistics.megabytes_read_per_second:.1f} MB/s read, "
+            f"elapsed {run_statistics.elapsed:.0f} s, eta {eta}")
+
+
+def format_stage_statistics(run_statistics: RunStatistics) -> str:
+    busy_seconds = sum(stage_statistics.total for stage_statistics in run_statistics.stages.values())
+    lines = [f"{'stage':<10} {'p50':>9} {'p95':>9} {'share':>6}"]
+    for stage, stage_statistics in run_statistics.stages.items():
+        share = stage_statistics.total / busy_seconds if busy_seconds else 0
+        lines.append(f"{stage:<10} {stage_statistics.p50 * 1000:7.1f}ms {stage_statistics.p95 * 1000:7.1f}ms "
+                     f"{share:6.1%}")
+    lines.append(f"{run_statistics.megabytes_read_per_second:.1f} MB/s read, "
+                 f"{run_statistics.megabytes_written_per_second:.1f} MB/s written")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(
+        stream=sys.stderr, level=logging.ERROR, format="%(asctime)s: %(message)s", datefmt="%Y-%m-%d %H:%M:%S%z"
+    )
+    logger = logging.getLogger("watermarker")
+    output_folders = [job.output_folder for job in args.jobs] or [args.output]
+
+    if len(args.images) == 1 and Path(args.images[0]).is_dir():
+        # A single folder is discovered while the run already marks the first images
+        images = []
+        source_folder = args.images[0]
+    else:
+        try:
+            images = collect_images(args.images, args.recursive, args.extensions, output_folders)
+        except FileNotFoundError as e:
+            print(e, file=sys.stderr)
+            return EXIT_USAGE
+        if not images:
+            print("No usable images found", file=sys.stderr)
+            return EXIT_USAGE
+        source_folder = os.path.commonpath([str(Path(image).parent) for image in images])
+    for output_folder in output_folders:
+        Path(output_folder).mkdir(parents=True, exist_ok=True)
+
+    marker = Marker(logger, max_workers=args.workers, engine=args.engine, stage_workers=args.stage_workers)
+    marker.images = images
+    marker.source_folder = source_folder
+    marker.recursive = args.recursive
+    marker.image_extensions = args.extensions
+    marker.watermark_path = args.watermark
+    marker.output_folder = args.output
+    marker.name_extension = args.name_extension
+    marker.padding_around_watermarks = args.padding_around
+    marker.padding_between_watermarks = args.padding_between
+    marker.incremental = args.incremental
+    marker.encoder_profile = args.encoder_profile
+    marker.output_format = args.output_format
+    marker.renditions = args.renditions
+    marker.jobs = args.jobs
+    marker.compositor = args.compositor
+    marker.memory_limit = args.memory_limit
+    if args.max_megapixels is not None:
+        marker.max_image_pixels = int(args.max_megapixels * 1_000_000) or None
+    marker.profiling = args.profile
+    marker.profile_folder = args.profile_folder
+    marker.shard = args.shard
+    marker.work_stealing = args.work_stealing
+    marker.claim_timeout = args.claim_timeout
+
+    # With several jobs the progress of all of them is kept in the output folder of the first one. The claims keep the
+    # progress of all processes stealing work, the journal of one of them would miss what the others did
+    if not args.work_stealing:
+        journal_name = f"{JOURNAL_FILE_NAME}-{args.shard[0]}-of-{args.shard[1]}" if args.shard else JOURNAL_FILE_NAME
+        marker.journal_path = str(Path(output_folders[0]).joinpath(journal_name))
+    if args.restart:
+        if marker.journal_path:
+            Path(marker.journal_path).unlink(missing_ok=True)
+        if args.work_stealing:
+            shutil.rmtree(marker.get_claims_folder(), ignore_errors=True)
+    else:
+        try:
+            if marker.resume_from_journal():
+                print(f"Resuming saved progress from {marker.journal_path}")
+        except StateChangeError as e:
+            print(f"{e}, run that command again or use --restart to discard it", file=sys.stderr)
+            return EXIT_USAGE
+
+    interrupted = False
+
+    def on_sigint(_signal_number, _frame) -> None:
+        nonlocal interrupted
+        interrupted = True
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    signal.signal(signal.SIGINT, on_sigint)
+
+    try:
+        marker.set_state("run")
+    except StateChangeError as e:
+        print(e, file=sys.stderr)
+        return EXIT_USAGE
+
+    next_progress_line = time.monotonic() + args.interval
+    try:
+        while marker.state not in [MarkerState.IDLE, MarkerState.PAUSED]:
+            time.sleep(min(0.1, args.interval))
+            if interrupted and marker.state == MarkerState.RUNNING:
+                print("Interrupted, finishing images in progress...")
+                marker.set_state("pause")
+            if time.monotonic() >= next_progress_line:
+                print(format_progress(marker.progress(), marker.run_statistics()), flush=True)
+                next_progress_line += args.interval
+    finally:
+        marker.shutdown(wait=True)
+
+    progress = marker.progress()
+    run_statistics = marker.run_statistics()
+    if args.stats:
+        print(format_stage_statistics(run_statistics))
+    for profile_file in marker.profile_files:
+        print(f"Profile written to {profile_file}")
+    if marker.state == MarkerState.PAUSED:
+        print(f"Progress saved to {marker.journal_path or marker.get_claims_folder()}, "
+              f"run the same command again to continue")
+        return EXIT_INTERRUPTED
+
+    print(f"Finished, {progress.done - progress.failed} of {progress.total} images marked "
+          f"in {run_statistics.elapsed:.1f} s"
+          f"{f', {progress.skipped} claimed by other processes' if progress.skipped else ''}")
+    if progress.failed:
+        print(f"{progress.failed} image{'s' if progress.failed > 1 else ''} failed, see the log above", file=sys.stderr)
+        return EXIT_FAILURES
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
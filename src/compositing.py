@@ -0,0 +1,53 @@
+from typing import Callable
+
+from PIL import Image
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+Compositor = Callable[[Image.Image, Image.Image, tuple[int, int]], None]
+
+NUMPY_MODES = ["RGB", "RGBA"]
+# Rows blended at once, so the uint16 arrays stay a few megabytes whatever the size of the overlay
+NUMPY_CHUNK_ROWS = 64
+
+
+def composite_pillow(image: Image.Image, overlay: Image.Image, position: tuple[int, int]) -> None:
+    image.paste(overlay, position, overlay)
+
+
+def composite_numpy(image: Image.Image, overlay: Image.Image, position: tuple[int, int]) -> None:
+    if image.mode not in NUMPY_MODES or overlay.mode != "RGBA":
+        composite_pillow(image, overlay, position)
+        return
+
+    x, y = position
+    bands = len(image.getbands())
+    for top in range(0, overlay.height, NUMPY_CHUNK_ROWS):
+        bottom = min(top + NUMPY_CHUNK_ROWS, overlay.height)
+        source = numpy.asarray(overlay.crop((0, top, overlay.width, bottom)))
+        alpha = source[..., 3:].astype(numpy.uint16)
+        if not alpha.any():
+            # The padding between the watermarks leaves the image as it is
+            continue
+        box = (x, y + top, x + overlay.width, y + bottom)
+        blended = numpy.asarray(image.crop(box), dtype=numpy.uint16)
+        # Same integer math as Pillow's paste with a mask: (image * (255 - alpha) + overlay * alpha) / 255, rounded
+        blended *= 255 - alpha
+        blended += source[..., :bands] * alpha
+        blended += 128
+        blended += blended >> 8
+        blended >>= 8
+        image.paste(Image.fromarray(blended.astype(numpy.uint8), image.mode), box)
+
+
+COMPOSITORS: dict[str, Compositor] = {
+    "pillow": composite_pillow,
+    "numpy": composite_numpy
+}
+
+
+def supported_compositors() -> list[str]:
+    return [name for name in COMPOSITORS if name != "numpy" or numpy is not None]
@@ -6,6 +6,7 @@ import flet as ft
 
 from controls.preview import Preview
 from controls.user_input import UserInput
+from helpers import s_word_multiples
 from marker import Marker, MarkerState, StateChangeError
 
 
@@ -38,14 +39,15 @@ class MarkerRun(ft.Row):
         if checks:
             if self._missing_user_input():
                 return
-            # TODO Check for output folder empty on restart after holiday
-            if self._marker.state != MarkerState.PAUSED and not self._user_input.output_folder_is_empty(
-                    self._marker.output_folder
-            ):
+            # TODO Check for overwritten files on restart after holiday
+            if self._marker.state != MarkerState.PAUSED and (
+                    overwritten_files := self._marker.find_overwritten_files()):
                 output_folder_not_empty_alert = ft.AlertDialog(
-                    title=ft.Text("Output folder is not empty. Do you still want to use it?"), content=ft.Text(
-                        "If resulting images have the same name as images already in the output folder, "
-                        "they will overwrite them!"
+                    title=ft.Text("Output folder already contains resulting images. Do you still want to use it?"),
+                    content=ft.Text(
+                        f"{len(overwritten_files)} image{s_word_multiples(overwritten_files)} in the output folder "
+                        f"that {'were' if len(overwritten_files) > 1 else 'was'} not created by the Watermarker "
+                        f"will be overwritten!"
                     ), actions=[ft.TextButton(
                         "Yes", on_click=lambda _: self._output_folder_alert_yes(output_folder_not_empty_alert)
                     ), ft.TextButton("No", on_click=lambda _: self._page.close(output_folder_not_empty_alert))]
@@ -59,6 +61,15 @@ class MarkerRun(ft.Row):
             self._marker.set_state("run")
         except StateChangeError as e:
             self._logger.error(e, exc_info=True)
+            self._disable_user_input_fields(False)
+            alert = ft.AlertDialog(
+                actions=[ft.TextButton("Ok", on_click=lambda _: self._page.close(alert))],
+                title=ft.Text("Can't start"),
+                content=ft.Text(str(e)),
+                modal=True
+            )
+            self._page.open(alert)
+            return
         self._start_progress_display()
 
         while self._marker.state == MarkerState.RUNNING:
@@ -97,12 +108,17 @@ class MarkerRun(ft.Row):
         self._preview.loading(True)
 
     def _update_progress_display(self) -> None:
-        done = self._marker.amount_images_done()
-        total = self._marker.amount_images_todo() + done
+        progress = self._marker.progress()
+        run_statistics = self._marker.run_statistics()
+        done = progress.done
+        total = progress.total
+        eta = self.format_time_elapsed(run_statistics.eta) if run_statistics.eta is not None else "-"
         self._progress_text.value = (f"{done:{len(str(total))}}/"
-                                     f"{total:{len(str(total))}} Image{'s' if total > 1 else ''} marked")
+                                     f"{total:{len(str(total))}} Image{'s' if total > 1 else ''} marked, "
+                                     f"{run_statistics.images_per_second:.1f}/s, "
+                                     f"{self.format_time_elapsed(run_statistics.elapsed)} elapsed, {eta} left")
         self._progress_text.update()
-        self._progress_bar.value = done / total
+        self._progress_bar.value = done / total if total else None
         self._progress_bar.update()
 
     def pause(self, _=None) -> None:
@@ -130,10 +146,9 @@ class MarkerRun(ft.Row):
         self._pause_button.disabled = False
         self._cancel_button.disabled = False
         self._run_button.text = "Continue"
+        progress = self._marker.progress()
         self.controls = [ft.Text(
-            f"Paused ({self._marker.amount_images_done()}/"
-            f"{self._marker.amount_images_todo() + self._marker.amount_images_done()} "
-            f"Image{'s' if self._marker.amount_images_done() > 1 else ''} marked)"
+            f"Paused ({progress.done}/{progress.total} Image{'s' if progress.done > 1 else ''} marked)"
         ), self._run_button, self._cancel_button]
         self.update()
         self._preview.loading(False)
@@ -1,3 +1,5 @@
+from threading import Lock, Timer
+
 import flet as ft
 
 from marker import Marker
@@ -9,6 +11,11 @@ class Preview(ft.Stack):
 
         self._marker = marker
 
+        self._DEBOUNCE_DELAY = 0.3
+        self._render_lock = Lock()
+        self._render_generation = 0
+        self._render_timer: Timer | None = None
+
         self._image = ft.Image(src=image_src, fit=ft.ImageFit.CONTAIN)
         self._progress_ring = ft.ProgressRing(value=None, stroke_width=10, visible=False)
         self.resize(800, 800)
@@ -18,12 +25,35 @@ class Preview(ft.Stack):
         self.alignment = ft.alignment.center
 
     def set_preview(self) -> None:
-        self.loading(True)
-        self._marker.setup_preview_image_base64()
-        if self._marker.preview_image_base64:
-            self._image.src_base64 = self._marker.preview_image_base64
-            self._image.update()
-        self.loading(False)
+        self._render(self._next_render_generation())
+
+    def request_preview(self) -> None:
+        generation = self._next_render_generation()
+        self._render_timer = Timer(self._DEBOUNCE_DELAY, self._render, args=(generation,))
+        self._render_timer.daemon = True
+        self._render_timer.start()
+
+    def _next_render_generation(self) -> int:
+        if self._render_timer:
+            self._render_timer.cancel()
+            self._render_timer = None
+        self._render_generation += 1
+        return self._render_generation
+
+    def _render(self, generation: int) -> None:
+        with self._render_lock:
+            if generation != self._render_generation:
+                return
+            self.loading(True)
+            preview_image_base64 = self._marker.render_preview_image_base64(
+                lambda: generation != self._render_generation
+            )
+            if generation == self._render_generation:
+                self._marker.preview_image_base64 = preview_image_base64
+                if preview_image_base64:
+                    self._image.src_base64 = preview_image_base64
+                    self._image.update()
+                self.loading(False)
 
     def update_preview(self) -> None:
         if self._marker.preview_image_base64:
@@ -35,6 +65,7 @@ class Preview(ft.Stack):
         self._progress_ring.update()
 
     def resize(self, width: int, height: int) -> None:
+        self._marker.preview_size = (max(1, width), max(1, height))
         self.width = width
         self.height = height
         self._image.width = width
@@ -1,9 +1,9 @@
-import os
 from pathlib import Path
 
 import flet as ft
 
 from controls.preview import Preview
+from encoder_profiles import ENCODER_PROFILES, supported_output_formats
 from helpers import s_word_multiples
 from marker import Marker
 
@@ -32,7 +32,9 @@ class UserInput(ft.Column):
         page.overlay.append(images_picker)
         pick_images_button = ft.FilledTonalButton(
             "Pick multiple images", on_click=lambda _: images_picker.pick_files(
-                allow_multiple=True, file_type=ft.FilePickerFileType.CUSTOM, allowed_extensions=["png", "jpg", "jpeg"]
+                allow_multiple=True, file_type=ft.FilePickerFileType.CUSTOM, allowed_extensions=[
+                    extension.lstrip(".") for extension in self._marker.image_extensions
+                ]
             ), width=pick_buttons_width
         )
 
@@ -102,6 +104,45 @@ class UserInput(ft.Column):
             suffix_text="pixel"
         )
 
+        self.encoder_profile_dropdown = ft.Dropdown(
+            label="Encoder profile",
+            options=[ft.dropdown.Option(key, profile.label) for key, profile in ENCODER_PROFILES.items()],
+            value="default",
+            on_change=self._on_change_encoder_profile,
+            expand=True
+        )
+
+        self.output_format_dropdown = ft.Dropdown(
+            label="Output format",
+            options=[ft.dropdown.Option(
+                output_format, "Same as input" if output_format == "keep" else output_format.upper()
+            ) for output_format in supported_output_formats()],
+            value="keep",
+            on_change=self._on_change_output_format,
+            expand=True
+        )
+
+        self.memory_limit_text_field = ft.TextField(
+            label="Memory limit",
+            hint_text="Fewer images are marked at once to stay below this limit. Leave empty for no limit.",
+            input_filter=ft.InputFilter(allow=True, regex_string=r"^\d{0,4}(\.\d{0,2})?$", replacement_string=""),
+            on_blur=self._on_blur_memory_limit,
+            expand=True,
+            suffix_text="GB"
+        )
+
+        self.recursive_checkbox = ft.Checkbox(
+            label="Include images in sub folders",
+            value=self._marker.recursive,
+            on_change=self._on_change_recursive
+        )
+
+        self.incremental_checkbox = ft.Checkbox(
+            label="Skip images already marked with the same settings",
+            value=False,
+            on_change=self._on_change_incremental
+        )
+
         pick_buttons_row_width = 400
         pick_buttons_alignment = ft.MainAxisAlignment.START
         pick_buttons_cross_alignment = ft.CrossAxisAlignment.CENTER
@@ -132,26 +173,40 @@ class UserInput(ft.Column):
         ), ft.Row(
             [self.padding_around_text_field, self.padding_between_text_field,
              ft.Row([ft.Container()], width=pick_buttons_row_width)]
+        ), ft.Row(
+            [self.encoder_profile_dropdown, self.output_format_dropdown,
+             ft.Row([ft.Container()], width=pick_buttons_row_width)]
+        ), ft.Row(
+            [self.memory_limit_text_field, ft.Row([ft.Container()], width=pick_buttons_row_width)]
+        ), ft.Row(
+            [self.recursive_checkbox, self.incremental_checkbox]
         )]
 
         self.width = text_fields_width + pick_buttons_row_width
 
     def _on_image_folder_picker_result(self, e: ft.FilePickerResultEvent) -> None:
         if e.path:
-            self._marker.images = self._marker.find_images(e.path)
+            self._set_image_folder(e.path)
 
-            if self._marker.images:
-                self.set_images_text()
-                self._safe_images_paths(self._marker.images)
+    def _set_image_folder(self, path: str) -> None:
+        self._marker.images = self._marker.find_images(
+            path, self._marker.recursive, self._marker.output_folder, self._marker.log_discovery_error
+        )
 
-                self._preview.set_preview()
-            else:
-                self.images_text_field.error_text = "No usable images found in the folder"
-                self.images_text_field.update()
+        if self._marker.images:
+            self._marker.source_folder = path
+            self.set_images_text()
+            self._safe_images_paths(self._marker.images)
+
+            self._preview.set_preview()
+        else:
+            self.images_text_field.error_text = "No usable images found in the folder"
+            self.images_text_field.update()
 
     def _on_images_picker_result(self, e: ft.FilePickerResultEvent) -> None:
         if e.files:
             self._marker.images = [file.path for file in e.files]
+            self._marker.source_folder = None
 
             self.set_images_text()
             self._safe_images_paths(self._marker.images)
@@ -170,14 +225,16 @@ class UserInput(ft.Column):
 
     def _on_output_folder_picker_result(self, e: ft.FilePickerResultEvent) -> None:
         if e.path:
-            if self.output_folder_is_empty(e.path):
+            overwritten_files = self._marker.find_overwritten_files(e.path)
+            if not overwritten_files:
                 self._update_output_folder(e.path)
             else:
                 output_folder_not_empty_alert = ft.AlertDialog(
-                    title=ft.Text("Output folder is not empty. Do you still want to use it?"),
+                    title=ft.Text("Output folder already contains resulting images. Do you still want to use it?"),
                     content=ft.Text(
-                        "If resulting images have the same name as images already in "
-                        "the output folder, they will overwrite them!"
+                        f"{len(overwritten_files)} image{s_word_multiples(overwritten_files)} in the output folder "
+                        f"that {'were' if len(overwritten_files) > 1 else 'was'} not created by the Watermarker "
+                        f"will be overwritten!"
                     ),
                     actions=[ft.TextButton(
                         "Yes", on_click=lambda _: self._output_folder_alert_yes(output_folder_not_empty_alert, e.path)
@@ -186,10 +243,6 @@ class UserInput(ft.Column):
                 )
                 self._page.open(output_folder_not_empty_alert)
 
-    @staticmethod
-    def output_folder_is_empty(path: str) -> bool:
-        return not any(os.scandir(path))
-
     def _output_folder_alert_yes(self, alert: ft.AlertDialog, path: str) -> None:
         self._page.close(alert)
         self._update_output_folder(path)
@@ -205,6 +258,32 @@ class UserInput(ft.Column):
         self._marker.name_extension = e.control.value
         self._page.client_storage.set("watermarker.name_extension", e.control.value)
 
+    def _on_change_encoder_profile(self, e: ft.ControlEvent):
+        self._marker.encoder_profile = e.control.value
+        self._page.client_storage.set("watermarker.encoder_profile", e.control.value)
+
+    def _on_change_output_format(self, e: ft.ControlEvent):
+        self._marker.output_format = e.control.value
+        self._page.client_storage.set("watermarker.output_format", e.control.value)
+
+    def _on_blur_memory_limit(self, e: ft.ControlEvent):
+        try:
+            memory_limit = float(e.control.value) if e.control.value else None
+        except ValueError:
+            memory_limit = None
+        self._marker.memory_limit = int(memory_limit * 1024 ** 3) if memory_limit else None
+        self._page.client_storage.set("watermarker.memory_limit", memory_limit)
+
+    def _on_change_recursive(self, e: ft.ControlEvent):
+        self._marker.recursive = e.control.value
+        self._page.client_storage.set("watermarker.recursive", e.control.value)
+        if self._marker.source_folder:
+            self._set_image_folder(self._marker.source_folder)
+
+    def _on_change_incremental(self, e: ft.ControlEvent):
+        self._marker.incremental = e.control.value
+        self._page.client_storage.set("watermarker.incremental", e.control.value)
+
     def _on_change_padding_around(self, e: ft.ControlEvent):
         if not e.data:
             self.padding_around_text_field.value = "0"
@@ -212,7 +291,7 @@ class UserInput(ft.Column):
             e.data = "0"
         self._marker.padding_around_watermarks = int(e.data)
         self._page.client_storage.set("watermarker.padding_around", int(e.control.value))
-        self._preview.set_preview()
+        self._preview.request_preview()
 
     def _on_change_padding_between(self, e: ft.ControlEvent):
         if not e.data:
@@ -221,10 +300,10 @@ class UserInput(ft.Column):
             e.data = "0"
         self._marker.padding_between_watermarks = int(e.data)
         self._page.client_storage.set("watermarker.padding_between", int(e.control.value))
-        self._preview.set_preview()
+        self._preview.request_preview()
 
     def set_images_text(self) -> None:
-        parent_folder = Path(self._marker.images[0]).parent
+        parent_folder = self._marker.source_folder or Path(self._marker.images[0]).parent
         self.images_text_field.label = (f"{len(self._marker.images)} image{s_word_multiples(self._marker.images)} from "
                                         f"{parent_folder}")
         self.images_text_field.value = "; ".join([Path(image).name for image in self._marker.images])
@@ -233,3 +312,4 @@ class UserInput(ft.Column):
 
     def _safe_images_paths(self, images: list[str]) -> None:
         self._page.client_storage.set("watermarker.images", images)
+        self._page.client_storage.set("watermarker.source_folder", self._marker.source_folder)
@@ -0,0 +1,99 @@
+import io
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from PIL import Image
+
+from helpers import temporary_path
+
+
+@dataclass(frozen=True)
+class EncoderProfile:
+    label: str
+    options: dict[str, dict] = field(default_factory=dict)
+
+    def get_save_options(self, image_format: str) -> dict:
+        return self.options.get(image_format, {})
+
+
+ENCODER_PROFILES: dict[str, EncoderProfile] = {
+    "default": EncoderProfile("Default"),
+    "fast": EncoderProfile("Fast", {
+        "JPEG": {"quality": 90, "optimize": False, "progressive": False},
+        "PNG": {"compress_level": 1},
+        "WEBP": {"quality": 85, "method": 0},
+        "AVIF": {"quality": 80, "speed": 10}
+    }),
+    "small": EncoderProfile("Small", {
+        "JPEG": {"quality": 85, "optimize": True, "progressive": True, "subsampling": "4:2:0"},
+        "PNG": {"optimize": True, "compress_level": 9},
+        "WEBP": {"quality": 80, "method": 6},
+        "AVIF": {"quality": 60, "speed": 4}
+    }),
+    "best": EncoderProfile("Best quality", {
+        "JPEG": {"quality": 95, "subsampling": "4:4:4"},
+        "PNG": {"compress_level": 6},
+        "WEBP": {"quality": 95, "method": 4},
+        "AVIF": {"quality": 90, "speed": 6}
+    })
+}
+
+OUTPUT_FORMATS: dict[str, str | None] = {
+    "keep": None,
+    "jpeg": ".jpg",
+    "png": ".png",
+    "webp": ".webp",
+    "avif": ".avif"
+}
+
+# The modes each format can write, others are converted to RGB or RGBA first
+FORMAT_MODES: dict[str, list[str]] = {
+    "JPEG": ["1", "L", "RGB", "CMYK"],
+    "PNG": ["1", "L", "LA", "I", "I;16", "P", "RGB", "RGBA"],
+    "WEBP": ["RGB", "RGBA"],
+    "AVIF": ["RGB", "RGBA"]
+}
+
+
+def supported_output_formats() -> list[str]:
+    registered_extensions = Image.registered_extensions()
+    return [output_format for output_format, suffix in OUTPUT_FORMATS.items()
+            if suffix is None or registered_extensions.get(suffix) in Image.SAVE]
+
+
+def get_image_format(image_path: str) -> str:
+    return Image.registered_extensions()[Path(image_path).suffix.lower()]
+
+
+def _prepare_for_format(image: Image.Image, image_format: str) -> Image.Image:
+    modes = FORMAT_MODES.get(image_format)
+    if modes is None or image.mode in modes:
+        return image
+    # JPEG has no alpha channel
+    return image.convert("RGBA" if "RGBA" in modes and image.has_transparency_data else "RGB")
+
+
+def encode_image(image: Image.Image, image_path: str, encoder_profile: str) -> bytes:
+    image_format = get_image_format(image_path)
+    buffer = io.BytesIO()
+    _prepare_for_format(image, image_format).save(
+        buffer, image_format, **ENCODER_PROFILES[encoder_profile].get_save_options(image_format)
+    )
+    return buffer.getvalue()
+
+
+def save_image(image: Image.Image, image_path: str, encoder_profile: str) -> None:
+    image_format = get_image_format(image_path)
+    temp_path = temporary_path(image_path)
+    try:
+        with open(temp_path, "wb") as temp_file:
+            _prepare_for_format(image, image_format).save(
+                temp_file, image_format, **ENCODER_PROFILES[encoder_profile].get_save_options(image_format)
+            )
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, image_path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
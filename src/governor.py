@@ -0,0 +1,135 @@
+import os
+import time
+from pathlib import Path
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def get_resident_memory(include_children: bool = False) -> int | None:
+    # Only Linux exposes the memory of a process this cheaply, elsewhere the governor works from estimates alone
+    try:
+        resident_pages = int(Path("/proc/self/statm").read_text().split()[1])
+        if include_children:
+            resident_pages += sum(_get_resident_pages(pid) for pid in _get_child_pids())
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * _PAGE_SIZE
+
+
+def _get_child_pids() -> list[int]:
+    # Children are listed per thread, worker processes are started from whichever thread submitted first
+    child_pids = []
+    for task in Path("/proc/self/task").iterdir():
+        try:
+            child_pids += [int(pid) for pid in task.joinpath("children").read_text().split()]
+        except FileNotFoundError:
+            continue
+    return child_pids
+
+
+def _get_resident_pages(pid: int) -> int:
+    try:
+        return int(Path(f"/proc/{pid}/statm").read_text().split()[1])
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def parse_memory_size(value: str) -> int:
+    units = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+    value = value.strip().lower().removesuffix("b").removesuffix("i")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+class ConcurrencyGovernor:
+
+    def __init__(
+            self,
+            max_tasks: int,
+            memory_limit: int | None = None,
+            include_children: bool = False,
+            max_overlay_bytes: int = 0,
+            overlay_copies: int = 1,
+            adjust_interval: float = 1.0) -> None:
+        self.max_tasks = max_tasks
+        self.memory_limit = memory_limit
+        self._max_overlay_bytes = max_overlay_bytes * overlay_copies
+        self._overlay_copies = overlay_copies
+        self._overlays: set[tuple[str | None, tuple[int, int]]] = set()
+        self._overlay_bytes = 0
+        self._include_children = include_children
+        self._adjust_interval = adjust_interval
+        self.task_limit = max_tasks
+        self._tasks = 0
+        self._bytes_in_flight = 0
+        self._budget_scale = 1.0
+        self._base_memory = get_resident_memory(include_children) or 0
+        self._last_adjustment = time.monotonic()
+        self._completed_since_adjustment = 0
+        self._last_throughput = 0.0
+        self._last_change = 0
+
+    @property
+    def memory_budget(self) -> int | None:
+        if self.memory_limit is None:
+            return None
+        return max(0, int((self.memory_limit - self._base_memory) * self._budget_scale))
+
+    @staticmethod
+    def estimate_cost(image_size: tuple[int, int], bands: int) -> int:
+        # The decoded image plus one working copy for format conversion or encoding
+        return 2 * image_size[0] * image_size[1] * bands
+
+    def reserve_overlay(self, image_size: tuple[int, int], watermark_path: str | None = None) -> None:
+        if (watermark_path, image_size) in self._overlays:
+            return
+        self._overlays.add((watermark_path, image_size))
+        # An RGBA overlay is at most as big as the image and stays cached after its images are done, up to the size of
+        # the cache
+        overlay_bytes = image_size[0] * image_size[1] * 4 * self._overlay_copies
+        self._overlay_bytes = min(self._overlay_bytes + overlay_bytes, self._max_overlay_bytes)
+
+    def can_admit(self, cost: int) -> bool:
+        if self._tasks == 0:
+            # A single image over the budget still has to be marked, alone
+            return True
+        if self._tasks >= self.task_limit:
+            return False
+        return self.memory_budget is None or self._overlay_bytes + self._bytes_in_flight + cost <= self.memory_budget
+
+    def admit(self, cost: int) -> None:
+        self._tasks += 1
+        self._bytes_in_flight += cost
+
+    def release(self, cost: int) -> None:
+        self._tasks -= 1
+        self._bytes_in_flight -= cost
+        self._completed_since_adjustment += 1
+        if time.monotonic() - self._last_adjustment >= self._adjust_interval:
+            self._adjust()
+
+    def _adjust(self) -> None:
+        now = time.monotonic()
+        throughput = self._completed_since_adjustment / (now - self._last_adjustment)
+        self._last_adjustment = now
+        self._completed_since_adjustment = 0
+
+        resident_memory = get_resident_memory(self._include_children) if self.memory_limit else None
+        if resident_memory is not None and resident_memory > 0.9 * self.memory_limit:
+            # The estimates were too optimistic, back off hard before the system starts swapping
+            self.task_limit = max(1, self.task_limit // 2)
+            self._budget_scale = max(0.1, self._budget_scale * 0.75)
+            self._last_change = -1
+        elif resident_memory is not None and resident_memory < 0.7 * self.memory_limit and self._budget_scale < 1:
+            self._budget_scale = min(1.0, self._budget_scale * 1.1)
+        elif self._last_change > 0 and throughput < self._last_throughput * 0.95:
+            # More images at once made the run slower, e.g. because the disk or the caches are saturated
+            self.task_limit = max(1, self.task_limit - 1)
+            self._last_change = -1
+        elif self.task_limit < self.max_tasks:
+            self.task_limit += 1
+            self._last_change = 1
+        else:
+            self._last_change = 0
+        self._last_throughput = throughput
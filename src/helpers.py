@@ -1,2 +1,68 @@
+import json
+import os
+import socket
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+
 def s_word_multiples(list_: list) -> str:
     return "s" if len(list_) > 1 else ""
+
+
+def temporary_path(path: str | Path) -> Path:
+    path = Path(path)
+    return path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+
+
+def write_file_atomically(path: str | Path, data: bytes) -> None:
+    temp_path = temporary_path(path)
+    try:
+        with open(temp_path, "wb") as temp_file:
+            temp_file.write(data)
+            # Otherwise a crash can leave the renamed file empty, the rename may reach the disk before the data
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def create_file_exclusively(path: str | Path, data: bytes) -> bool:
+    # O_EXCL makes creating the file atomic, also on network shares, so only one of several processes succeeds
+    try:
+        file_descriptor = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(file_descriptor, "wb") as file:
+        file.write(data)
+    return True
+
+
+def remove_if_stale(path: str | Path, stale_after: float) -> bool:
+    path = Path(path)
+    try:
+        if time.time() - path.stat().st_mtime < stale_after:
+            return False
+        # Renaming is atomic too, of several processes finding the same stale file only one removes it
+        stale_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.stale")
+        os.rename(path, stale_path)
+    except FileNotFoundError:
+        return True
+    stale_path.unlink(missing_ok=True)
+    return True
+
+
+@contextmanager
+def file_lock(path: str | Path, stale_after: float = 30.0, poll_interval: float = 0.05) -> Iterator[None]:
+    owner = json.dumps({"host": socket.gethostname(), "pid": os.getpid()}).encode("utf-8")
+    while not create_file_exclusively(path, owner):
+        if not remove_if_stale(path, stale_after):
+            time.sleep(poll_interval)
+    try:
+        yield
+    finally:
+        Path(path).unlink(missing_ok=True)
@@ -0,0 +1,145 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import TextIO
+
+
+class Journal:
+
+    def __init__(self, path: str, compact_after: int = 10_000, sync_interval: float = 1.0) -> None:
+        self.path = Path(path)
+        self._compact_after = compact_after
+        self._sync_interval = sync_interval
+        self._file: TextIO | None = None
+        self._images_todo: dict[str, None] = {}
+        self._images_done: list[str] = []
+        # Images that only some of the jobs still have to mark
+        self._jobs_todo: dict[str, list[int]] = {}
+        self._discovering = False
+        # Identifies the run, so saved progress isn't resumed by a different one
+        self._fingerprint = ""
+        self._records_since_compaction = 0
+        self._last_sync = 0.0
+
+    def start(
+            self,
+            images_todo: list[str],
+            images_done: list[str],
+            discovering: bool = False,
+            jobs_todo: dict[str, list[int]] | None = None,
+            fingerprint: str = "") -> None:
+        self._images_todo = dict.fromkeys(images_todo)
+        self._images_done = images_done.copy()
+        self._jobs_todo = (jobs_todo or {}).copy()
+        self._discovering = discovering
+        self._fingerprint = fingerprint
+        self._compact()
+
+    def load(self) -> tuple[list[str], list[str], bool, dict[str, list[int]], str] | None:
+        if not self.path.exists():
+            return None
+
+        images_todo: dict[str, None] = {}
+        images_done: list[str] = []
+        jobs_todo: dict[str, list[int]] = {}
+        discovering = False
+        fingerprint = ""
+        with open(self.path, encoding="utf-8") as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A crash can leave the last record half written, everything before it is intact.
+                    break
+                if "snapshot" in record:
+                    images_todo = dict.fromkeys(record["snapshot"]["todo"])
+                    images_done = record["snapshot"]["done"]
+                    jobs_todo = record["snapshot"].get("jobs", {})
+                    discovering = record["snapshot"].get("discovering", False)
+                    fingerprint = record["snapshot"].get("fingerprint", "")
+                elif "todo" in record:
+                    images_todo[record["todo"]] = None
+                    if "jobs" in record:
+                        jobs_todo[record["todo"]] = record["jobs"]
+                elif "discovered" in record:
+                    discovering = False
+                elif record.get("done") in images_todo:
+                    del images_todo[record["done"]]
+                    jobs_todo.pop(record["done"], None)
+                    images_done.append(record["done"])
+
+        self._images_todo = images_todo
+        self._images_done = images_done
+        self._jobs_todo = jobs_todo
+        self._discovering = discovering
+        self._fingerprint = fingerprint
+        return list(images_todo), images_done.copy(), discovering, jobs_todo.copy(), fingerprint
+
+    def append_todo(self, image_path: str, job_indices: list[int] | None = None) -> None:
+        self._images_todo[image_path] = None
+        if job_indices is None:
+            self._write({"todo": image_path}, flush=False)
+        else:
+            self._jobs_todo[image_path] = job_indices
+            self._write({"todo": image_path, "jobs": job_indices}, flush=False)
+
+    def finish_discovery(self) -> None:
+        self._discovering = False
+        self._write({"discovered": True})
+
+    def append_done(self, image_path: str) -> None:
+        if image_path not in self._images_todo:
+            return
+        del self._images_todo[image_path]
+        self._jobs_todo.pop(image_path, None)
+        self._images_done.append(image_path)
+        self._write({"done": image_path})
+
+    def _write(self, record: dict, flush: bool = True) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record) + "\n")
+        self._records_since_compaction += 1
+        if not flush:
+            return
+        self._file.flush()
+
+        if self._records_since_compaction >= self._compact_after:
+            self._compact()
+        elif time.monotonic() - self._last_sync >= self._sync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+    def _compact(self) -> None:
+        self.close()
+        temp_path = self.path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as temp_file:
+            temp_file.write(json.dumps({"snapshot": {
+                "todo": list(self._images_todo),
+                "done": self._images_done,
+                "jobs": self._jobs_todo,
+                "discovering": self._discovering,
+                "fingerprint": self._fingerprint
+            }}))
+            temp_file.write("\n")
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, self.path)
+        self._records_since_compaction = 0
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def remove(self) -> None:
+        self.close()
+        self.path.unlink(missing_ok=True)
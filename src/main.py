@@ -1,4 +1,6 @@
 import logging
+import os
+from pathlib import Path
 
 import flet
 from flet.core.page import Page
@@ -6,6 +8,7 @@ from flet.core.page import Page
 from app import MarkerApp
 from logging_handler import MarkerLoggerHandler
 from marker import Marker
+from profiling import PROFILING_ENVIRONMENT_VARIABLE, parse_profiling_modes
 
 
 def main(page: Page):
@@ -20,6 +23,12 @@ def main(page: Page):
         datefmt="%Y-%m-%d %H:%M:%S%z"
     )
     marker = Marker(logger)
+    marker.journal_path = "watermarker.journal"
+    try:
+        marker.profiling = parse_profiling_modes(os.environ.get(PROFILING_ENVIRONMENT_VARIABLE))
+    except ValueError as e:
+        logger.error(e)
+    marker.profile_folder = str(Path(log_file_name).resolve().parent)
     marker_app = MarkerApp(page, marker, logger)
     logger.addHandler(MarkerLoggerHandler(log_file_name, marker_app))
     marker_app.load_data()
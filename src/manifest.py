@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from helpers import file_lock, write_file_atomically
+
+MANIFEST_FILE_NAME = ".watermarker-manifest.json"
+MANIFEST_VERSION = 1
+
+
+class Manifest:
+
+    def __init__(self, output_folder: str, shared: bool = False) -> None:
+        self.output_folder = output_folder
+        self.shared = shared
+        self._path = Path(output_folder).joinpath(MANIFEST_FILE_NAME)
+        self._entries: dict[str, dict] = self._load_entries()
+        self._changed_keys: set[str] = set()
+
+    def _load_entries(self) -> dict[str, dict]:
+        if not self._path.exists():
+            return {}
+        try:
+            manifest = json.loads(self._path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        return manifest["entries"] if manifest.get("version") == MANIFEST_VERSION else {}
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        with open(path, "rb") as file:
+            return hashlib.file_digest(file, "sha256").hexdigest()
+
+    @staticmethod
+    def _source_entry(image_path: str) -> dict:
+        stat = os.stat(image_path)
+        return {"source": os.path.abspath(image_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _key(self, marked_image_path: str) -> str:
+        return Path(marked_image_path).relative_to(self.output_folder).as_posix()
+
+    def is_tracked(self, marked_image_path: str) -> bool:
+        return self._key(marked_image_path) in self._entries
+
+    def is_up_to_date(self, image_path: str, marked_image_path: str, settings: dict) -> bool:
+        entry = self._entries.get(self._key(marked_image_path))
+        if not entry or entry["settings"] != settings or not Path(marked_image_path).exists():
+            return False
+        try:
+            source_entry = self._source_entry(image_path)
+        except OSError:
+            return False
+        return all(entry[key] == value for key, value in source_entry.items())
+
+    def record(self, image_path: str, marked_image_path: str, settings: dict) -> None:
+        key = self._key(marked_image_path)
+        self._entries[key] = self._source_entry(image_path) | {"settings": settings}
+        self._changed_keys.add(key)
+
+    def save(self) -> None:
+        if not self._changed_keys:
+            return
+        if self.shared:
+            # Other processes write to the same output folder, keep what they recorded since this one loaded it
+            with file_lock(self._path.with_name(f"{MANIFEST_FILE_NAME}.lock")):
+                self._entries = self._load_entries() | {key: self._entries[key] for key in self._changed_keys}
+                self._write()
+        else:
+            self._write()
+        self._changed_keys.clear()
+
+    def _write(self) -> None:
+        data = json.dumps({"version": MANIFEST_VERSION, "entries": self._entries})
+        write_file_atomically(self._path, data.encode("utf-8"))
@@ -1,19 +1,40 @@
 import base64
+import hashlib
 import io
-import logging
+import json
+import multiprocessing
 import os
-from concurrent.futures import Future, ThreadPoolExecutor
+import traceback
+from concurrent.futures import BrokenExecutor, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import astuple, dataclass
 from enum import Enum
+from functools import partial
+from itertools import chain
 from logging import Logger
 from pathlib import Path
-from threading import Thread
-from time import sleep
-from typing import Literal
+from queue import SimpleQueue
+from threading import Lock, Thread
+from typing import Callable, Iterator, Literal
 
 from PIL import Image
 from PIL.Image import Resampling
 from PIL.ImageFile import ImageFile
 
+from compositing import COMPOSITORS
+from encoder_profiles import OUTPUT_FORMATS, encode_image, save_image
+from governor import ConcurrencyGovernor
+from helpers import s_word_multiples, write_file_atomically
+from journal import Journal
+from manifest import Manifest
+from pipeline import PIPELINE_STAGES, Pipeline
+from preview_cache import PreviewCache
+from profiling import RunProfiler
+from renditions import Rendition, RenditionOutput, get_rendition_padding, get_rendition_size
+from run_stats import ImageMetrics, RunStatistics, RunStats
+from sharding import CLAIMS_FOLDER_NAME, ClaimFolder, get_image_key, is_in_shard
+from watermark_cache import WatermarkCache, WatermarkLayout
+from watermark_jobs import WatermarkJob
+
 
 class MarkerState(Enum):
     IDLE = "idle"
@@ -38,227 +59,1232 @@ class MarkerRunError(Exception):
         super().__init__(message)
 
 
+MarkerEngine = Literal["thread", "process", "pipeline"]
+
+# Images from this size on skip the cached overlay and are written straight to disk to keep the peak memory down
+LARGE_IMAGE_PIXELS = 100_000_000
+# Overlays built before the run starts, the less common ones are built by the workers in parallel when needed
+MAX_PREWARMED_OVERLAYS = 16
+
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff", ".bmp", ".heic", ".heif", ".avif"]
+
+
+def supported_image_extensions() -> list[str]:
+    registered_extensions = Image.registered_extensions()
+    return [extension for extension in IMAGE_EXTENSIONS if extension in registered_extensions]
+
+
+@dataclass(frozen=True)
+class MarkerProgress:
+    done: int
+    todo: int
+    failed: int
+    discovering: bool = False
+    # Claimed by other processes sharing the output folder
+    skipped: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.done + self.todo
+
+
+@dataclass(frozen=True)
+class LayoutPlan:
+    image_groups: dict[tuple[int, int, str], list[str]]
+    # One layout per rendition of every image size
+    layouts: dict[tuple[int, int], list[WatermarkLayout]]
+    impossible_sizes: dict[tuple[int, int], str]
+    unreadable_images: list[str]
+
+    @property
+    def impossible_images(self) -> list[str]:
+        return [image_path for (width, height, _), image_paths in self.image_groups.items()
+                if (width, height) in self.impossible_sizes for image_path in image_paths]
+
+
 class Marker:
 
-    def __init__(self, logger: Logger, max_workers: int = max(1, os.cpu_count() - 2)):
+    def __init__(
+            self,
+            logger: Logger,
+            max_workers: int = max(1, os.cpu_count() - 2),
+            engine: MarkerEngine = "thread",
+            preview_cache_dir: str | None = None,
+            max_in_flight: int | None = None,
+            stage_workers: dict[str, int] | None = None):
         self._max_workers = max_workers
+        self.stage_workers: dict[str, int] = dict(zip(PIPELINE_STAGES, [2, max_workers, max_workers, 4])) | (
+            stage_workers or {}
+        )
+        self.max_in_flight = max_in_flight or 2 * max_workers
+        self.engine: MarkerEngine = engine
         self._logger = logger
+        self._watermark_cache = WatermarkCache()
+        self._preview_cache = PreviewCache(cache_dir=preview_cache_dir)
+        self._executor: Executor | Pipeline | None = None
+        self._executor_key: tuple | None = None
+        # Completed futures of the current run, None wakes the run up to cancel the images not started yet
+        self._completed: SimpleQueue[Future | None] | None = None
 
         self._state: MarkerState = MarkerState.IDLE
-        self.preview_image_base64: str | None = None
-        self.UPDATE_INTERVAL = 0.2
+        self._preview_image_base64: str | None = None
+        self._preview_rendered_path: str | None = None
+        self._latest_marked_image_path: str | None = None
+        self.preview_size: tuple[int, int] = (800, 800)
 
         self.images: list[str] = []
-        self._images_todo: list[str] = []
+        self.source_folder: str | None = None
+        self.recursive: bool = True
+        self.image_extensions: list[str] = supported_image_extensions()
+        self._discovery: Iterator[str] | None = None
+        self._progress_lock = Lock()
+        # The jobs still to do per image, None for all of them
+        self._images_todo: dict[str, list[int] | None] = {}
         self._images_done: list[str] = []
+        self._images_failed: list[str] = []
+        self._images_skipped: list[str] = []
+        self._run_stats = RunStats()
+        self.memory_limit: int | None = None
+        self.profiling: list[str] = []
+        self.profile_folder: str = "."
+        self.profile_files: list[str] = []
+        self._profiler: RunProfiler | None = None
         self.watermark_path: str | None = None
         self.output_folder: str | None = None
         self.name_extension: str = ""
+        self.encoder_profile: str = "default"
+        self.output_format: str = "keep"
+        self.renditions: list[Rendition] = []
+        self.jobs: list[WatermarkJob] = []
         self.padding_around_watermarks: int = 0
         self.padding_between_watermarks: int = 0
+        self.compositor: str = "pillow"
+        self._layout_plan: LayoutPlan | None = None
+        self.incremental: bool = False
+        self._manifests: dict[str, Manifest] = {}
+        self._output_settings: list[dict] = []
+        self.journal_path: str | None = None
+        self._journal: Journal | None = None
+        # Index from 1 and count of the shard to mark, the other shards are left to other processes or machines
+        self.shard: tuple[int, int] | None = None
+        self.work_stealing: bool = False
+        self.claim_timeout: float = 600.0
+        self._claims: ClaimFolder | None = None
+        self._claim_names: dict[str, str] = {}
 
     @property
     def state(self) -> MarkerState:
         return self._state
 
+    @property
+    def preview_image_base64(self) -> str | None:
+        latest_marked_image_path = self._latest_marked_image_path
+        if latest_marked_image_path and latest_marked_image_path != self._preview_rendered_path:
+            self._preview_rendered_path = latest_marked_image_path
+            if thumbnail_base64 := self._get_thumbnail_base64(latest_marked_image_path):
+                self._preview_image_base64 = thumbnail_base64
+        return self._preview_image_base64
+
+    @preview_image_base64.setter
+    def preview_image_base64(self, value: str | None) -> None:
+        self._latest_marked_image_path = None
+        self._preview_image_base64 = value
+
     def setup_preview_image_base64(self) -> None:
         if self.images:
-            if self.watermark_path:
-                self.preview_image_base64 = self._get_marked_image_base64(self.images[0])
-            else:
-                with Image.open(self.images[0]) as image:
-                    self.preview_image_base64 = self.convert_to_base64(image)
+            self.preview_image_base64 = self.render_preview_image_base64()
+
+    def render_preview_image_base64(self, is_stale: Callable[[], bool] = lambda: False) -> str | None:
+        if not self.images:
+            return None
+        image_path = self.images[0]
+        # noinspection PyBroadException
+        try:
+            preview_key = self._get_preview_key(image_path)
+            if preview_base64 := self._preview_cache.get(preview_key):
+                return preview_base64
+
+            with Image.open(image_path) as image:
+                original_width = image.width
+                image.thumbnail(self.preview_size)
+                if is_stale():
+                    return None
+                if self.watermark_path:
+                    scale = image.width / original_width
+                    self._place_watermark(
+                        image,
+                        self.watermark_path,
+                        round(self.padding_around_watermarks * scale),
+                        round(self.padding_between_watermarks * scale),
+                        self._watermark_cache,
+                        image_path,
+                        self.compositor
+                    )
+                    if is_stale():
+                        return None
+                preview_base64 = self.convert_to_base64(image)
+            self._preview_cache.put(preview_key, preview_base64)
+            return preview_base64
+        except Exception:
+            self._logger.error("Error placing watermark!", exc_info=True)
+            self._logger.error(f"{image_path=}, {self.watermark_path=}")
+            return None
+
+    def _get_preview_key(self, image_path: str) -> tuple:
+        watermark_key = None
+        if self.watermark_path:
+            watermark_key = (os.path.abspath(self.watermark_path), os.stat(self.watermark_path).st_mtime_ns)
+        return (
+            os.path.abspath(image_path),
+            os.stat(image_path).st_mtime_ns,
+            watermark_key,
+            self.padding_around_watermarks,
+            self.padding_between_watermarks,
+            self.preview_size
+        )
 
     @property
-    def images_todo(self):
-        return self._images_todo
+    def images_todo(self) -> list[str]:
+        with self._progress_lock:
+            return list(self._images_todo)
 
     def amount_images_todo(self) -> int:
         return len(self._images_todo)
 
     @property
-    def images_done(self):
-        return self._images_done
+    def images_done(self) -> list[str]:
+        with self._progress_lock:
+            return self._images_done.copy()
 
     def amount_images_done(self) -> int:
         return len(self._images_done)
 
+    @property
+    def images_failed(self) -> list[str]:
+        with self._progress_lock:
+            return self._images_failed.copy()
+
+    def progress(self) -> MarkerProgress:
+        with self._progress_lock:
+            return MarkerProgress(
+                len(self._images_done),
+                len(self._images_todo),
+                len(self._images_failed),
+                self._discovery is not None,
+                len(self._images_skipped)
+            )
+
+    @property
+    def max_image_pixels(self) -> int | None:
+        return Image.MAX_IMAGE_PIXELS
+
+    @max_image_pixels.setter
+    def max_image_pixels(self, max_image_pixels: int | None) -> None:
+        # Pillow's decompression bomb check is global to the process, worker processes get it on start
+        Image.MAX_IMAGE_PIXELS = max_image_pixels
+
+    def run_statistics(self) -> RunStatistics:
+        progress = self.progress()
+        return self._run_stats.snapshot(None if progress.discovering else progress.todo)
+
     def set_state(self, new_state: Literal["run", "pause", "cancel"]) -> None:
         match new_state:
             case "run" if self.state in [MarkerState.IDLE, MarkerState.PAUSED]:
+                missing_items = [item for item, condition in
+                                 [("images", self.images or self.source_folder or self.state == MarkerState.PAUSED),
+                                  ("watermark", self.jobs or self.watermark_path),
+                                  ("output folder", self.jobs or self.output_folder)] if not condition]
+                if missing_items:
+                    raise StateChangeError(
+                        f"Missing {', '.join(missing_items)}", self.state, MarkerState.RUNNING
+                    )
+                if len(self.renditions) > len(set(map(self._get_rendition_target, self.renditions))):
+                    raise StateChangeError(
+                        "Renditions need different suffixes, folders or formats", self.state, MarkerState.RUNNING
+                    )
+                if len(self.jobs) > len({os.path.abspath(job.output_folder) for job in self.jobs}):
+                    raise StateChangeError(
+                        "Watermark jobs need different output folders", self.state, MarkerState.RUNNING
+                    )
+                try:
+                    self._output_settings = [self._get_output_settings(job) for job in self._get_jobs()]
+                    # Loading the watermarks now also covers planning the layouts, which needs their sizes
+                    for job in self._get_jobs():
+                        self._watermark_cache.get_source(job.watermark_path)
+                except OSError as e:
+                    raise StateChangeError(f"Can't read the watermark: {e}", self.state, MarkerState.RUNNING)
                 if self.state == MarkerState.IDLE:
-                    missing_items = [item for item, condition in
-                                     [("images", self.images), ("watermark", self.watermark_path),
-                                      ("output folder", self.output_folder)] if not condition]
-                    if missing_items:
+                    images = [image_path for image_path in self.images if self._is_in_shard(image_path)]
+                    images_todo = dict.fromkeys(images)
+                    if self.incremental:
+                        images_todo = {image_path: self._get_jobs_todo(image_path, self._output_settings)
+                                       for image_path in images}
+                        images_todo = {image_path: job_indices for image_path, job_indices in images_todo.items()
+                                       if job_indices != []}
+                    self._layout_plan = self.plan_layouts(list(images_todo)) if images_todo else None
+                    if self._layout_plan and (impossible_images := self._layout_plan.impossible_images):
                         raise StateChangeError(
-                            f"Missing {', '.join(missing_items)}", self.state, MarkerState.RUNNING
+                            f"Padding is too big for {len(impossible_images)} "
+                            f"image{s_word_multiples(impossible_images)}, e.g. {impossible_images[0]}",
+                            self.state,
+                            MarkerState.RUNNING
+                        )
+                    with self._progress_lock:
+                        self._images_todo = images_todo
+                        self._images_done = []
+                        self._images_failed = []
+                        self._images_skipped = []
+                    if not self.images:
+                        self._discovery = self.iter_images(
+                            self.source_folder,
+                            self.recursive,
+                            self.image_extensions,
+                            self._get_output_folders(),
+                            self.log_discovery_error
                         )
-                    self._images_todo = self.images.copy()
-                    self._images_done = []
+                self._journal = Journal(self.journal_path) if self.journal_path else None
+                self._update_journal(lambda journal: journal.start(
+                    self.images_todo,
+                    self.images_done,
+                    self._discovery is not None,
+                    self._get_partial_jobs_todo(),
+                    self._get_run_fingerprint()
+                ))
+                self._run_stats = RunStats()
+                self._start_profiler()
+                self._completed = SimpleQueue()
                 self._state = MarkerState.RUNNING
                 Thread(target=self._run).start()
             case "pause" if self.state == MarkerState.RUNNING:
                 self._state = MarkerState.PAUSING
+                self._completed.put(None)
             case "cancel" if self.state == MarkerState.RUNNING:
                 self._state = MarkerState.CANCELING
+                self._completed.put(None)
             case "cancel" if self.state == MarkerState.PAUSED:
-                self._images_todo.extend(self._images_done)
+                with self._progress_lock:
+                    self._images_todo.update(dict.fromkeys(self._images_done + self._images_skipped))
+                self._discovery = None
+                self._remove_journal()
                 self._state = MarkerState.IDLE
             case _:
                 raise StateChangeError(
                     f"Can't do state change from {self._state} to {new_state}", self._state, new_state
                 )
 
-    def resume_after_holiday(self, images_todo: list[str], images_done: list[str]) -> None:
-        self._images_todo = images_todo
-        self._images_done = images_done
+    def plan_layouts(self, images: list[str] | None = None) -> LayoutPlan:
+        image_groups: dict[tuple[int, int, str], list[str]] = {}
+        unreadable_images = []
+        for image_path in self.images if images is None else images:
+            try:
+                # Opening is lazy, only the header is read until the pixels are accessed
+                with Image.open(image_path) as image:
+                    image_groups.setdefault((*image.size, image.mode), []).append(image_path)
+            except (OSError, Image.DecompressionBombError):
+                unreadable_images.append(image_path)
+
+        jobs = self._get_jobs()
+        watermark_sizes = [self._watermark_cache.get_source(job.watermark_path).size for job in jobs]
+        layouts = {}
+        impossible_sizes = {}
+        for image_size in dict.fromkeys((width, height) for width, height, _ in image_groups):
+            try:
+                layouts[image_size] = [
+                    self._get_layout(
+                        rendition_size,
+                        watermark_size,
+                        get_rendition_padding(job.padding_around, image_size, rendition_size),
+                        get_rendition_padding(job.padding_between, image_size, rendition_size),
+                        f"{rendition_size[0]}x{rendition_size[1]}"
+                    ) for job, watermark_size in zip(jobs, watermark_sizes)
+                    for rendition_size in self._get_rendition_sizes(image_size)
+                ]
+            except MarkerRunError as e:
+                impossible_sizes[image_size] = str(e)
+        return LayoutPlan(image_groups, layouts, impossible_sizes, unreadable_images)
+
+    def _prewarm_overlays(self, layout_plan: LayoutPlan) -> None:
+        amount_images: dict[tuple[str, WatermarkLayout], int] = {}
+        for (width, height, _), image_paths in layout_plan.image_groups.items():
+            rendition_sizes = [(job.watermark_path, rendition_size) for job in self._get_jobs()
+                               for rendition_size in self._get_rendition_sizes((width, height))]
+            for (watermark_path, rendition_size), layout in zip(
+                    rendition_sizes, layout_plan.layouts.get((width, height), [])):
+                if rendition_size[0] * rendition_size[1] < LARGE_IMAGE_PIXELS:
+                    overlay_key = (watermark_path, layout)
+                    amount_images[overlay_key] = amount_images.get(overlay_key, 0) + len(image_paths)
+        free_bytes = self._watermark_cache.max_overlay_bytes
+        prewarm_overlays = []
+        overlay_keys = sorted(amount_images, key=amount_images.get, reverse=True)
+        for watermark_path, layout in overlay_keys[:MAX_PREWARMED_OVERLAYS]:
+            overlay_width, overlay_height = layout.overlay_size
+            free_bytes -= overlay_width * overlay_height * len(
+                self._watermark_cache.get_source(watermark_path).getbands()
+            )
+            if free_bytes < 0:
+                break
+            prewarm_overlays.append((watermark_path, layout))
+        # Building the overlays of the most common sizes up front keeps the first workers from all building them at
+        # once, the most common one is built last so it is the least likely to be evicted
+        for watermark_path, layout in reversed(prewarm_overlays):
+            self._watermark_cache.get_overlay(watermark_path, layout)
+
+    def _start_profiler(self) -> None:
+        self._profiler = None
+        if not self.profiling:
+            return
+        self._profiler = RunProfiler(self.profile_folder, self.profiling)
+        self._profiler.start()
+
+    def _stop_profiler(self) -> None:
+        if self._profiler is None:
+            return
+        try:
+            self.profile_files = [str(path) for path in self._profiler.stop()]
+        except OSError:
+            self._logger.error("Error writing the profile!", exc_info=True)
+            self._logger.error(f"{self.profile_folder=}")
+        self._profiler = None
+
+    def _profiled(self, function: Callable) -> Callable:
+        if self._profiler is None or self.engine == "process":
+            return function
+        return self._profiler.wrap(function)
+
+    def _get_manifest(self, output_folder: str) -> Manifest:
+        if output_folder not in self._manifests:
+            self._manifests[output_folder] = Manifest(output_folder)
+        # Other processes marking the same images write to the same manifest
+        self._manifests[output_folder].shared = self.shard is not None or self.work_stealing
+        return self._manifests[output_folder]
+
+    def _get_output_settings(self, job: WatermarkJob) -> dict:
+        return {
+            "watermark_sha256": Manifest.hash_file(job.watermark_path),
+            "padding_around": job.padding_around,
+            "padding_between": job.padding_between,
+            "name_extension": self.name_extension,
+            "encoder_profile": self.encoder_profile,
+            "output_format": self.output_format
+        }
+
+    def _get_rendition_settings(self, settings: dict, rendition: Rendition) -> dict:
+        rendition_settings = settings | {
+            "encoder_profile": rendition.encoder_profile or self.encoder_profile,
+            "output_format": rendition.output_format or self.output_format
+        }
+        if rendition.max_size is not None:
+            rendition_settings["max_size"] = rendition.max_size
+        return rendition_settings
+
+    def _is_up_to_date(self, image_path: str, job: WatermarkJob, settings: dict) -> bool:
+        manifest = self._get_manifest(job.output_folder)
+        return all(
+            manifest.is_up_to_date(
+                image_path,
+                self._get_rendition_path(image_path, job.output_folder, rendition),
+                self._get_rendition_settings(settings, rendition)
+            ) for rendition in self._get_renditions()
+        )
+
+    def _get_jobs_todo(self, image_path: str, output_settings: list[dict]) -> list[int] | None:
+        job_indices = [job_index for job_index, job in enumerate(self._get_jobs())
+                       if not self._is_up_to_date(image_path, job, output_settings[job_index])]
+        return None if len(job_indices) == len(output_settings) else job_indices
+
+    def get_outdated_images(self) -> list[str]:
+        output_settings = [self._get_output_settings(job) for job in self._get_jobs()]
+        return [image_path for image_path in self.images if self._get_jobs_todo(image_path, output_settings) != []]
+
+    def find_overwritten_files(self, output_folder: str | None = None) -> list[str]:
+        overwritten_files = []
+        for job in self._get_jobs(output_folder):
+            manifest = self._get_manifest(job.output_folder)
+            marked_image_paths = [
+                self._get_rendition_path(image_path, job.output_folder, rendition)
+                for image_path in self.images for rendition in self._get_renditions()
+            ]
+            overwritten_files += [marked_image_path for marked_image_path in marked_image_paths
+                                  if Path(marked_image_path).exists() and not manifest.is_tracked(marked_image_path)]
+        return overwritten_files
+
+    def resume_from_journal(self) -> bool:
+        if not self.journal_path:
+            return False
+        try:
+            progress = Journal(self.journal_path).load()
+        except OSError:
+            self._logger.error("Error reading the progress journal!", exc_info=True)
+            self._logger.error(f"{self.journal_path=}")
+            return False
+        if not progress:
+            return False
+        images_todo, images_done, discovering, jobs_todo, fingerprint = progress
+        if fingerprint != self._get_run_fingerprint():
+            raise StateChangeError(
+                f"The progress saved in {self.journal_path} is from a run with other images or settings",
+                self.state,
+                MarkerState.PAUSED
+            )
+        if discovering and self.source_folder:
+            known_images = set(images_todo) | set(images_done)
+            self._discovery = (image_path for image_path in self.iter_images(
+                self.source_folder,
+                self.recursive,
+                self.image_extensions,
+                self._get_output_folders(),
+                self.log_discovery_error
+            ) if image_path not in known_images)
+        elif not images_todo:
+            return False
+        self.resume_after_holiday(images_todo, images_done, jobs_todo)
+        return True
+
+    def _get_run_fingerprint(self) -> str:
+        def absolute_path(path: str | None) -> str | None:
+            return os.path.abspath(path) if path else None
+
+        run = {
+            "images": sorted(map(absolute_path, self.images)),
+            "source_folder": absolute_path(self.source_folder),
+            "recursive": self.recursive,
+            "image_extensions": self.image_extensions,
+            "jobs": [[absolute_path(job.watermark_path), absolute_path(job.output_folder), job.padding_around,
+                      job.padding_between] for job in self._get_jobs()],
+            "renditions": [astuple(rendition) for rendition in self._get_renditions()],
+            "name_extension": self.name_extension,
+            "encoder_profile": self.encoder_profile,
+            "output_format": self.output_format,
+            "incremental": self.incremental,
+            "shard": self.shard
+        }
+        return hashlib.sha256(json.dumps(run).encode("utf-8")).hexdigest()
+
+    def _update_journal(self, update: Callable[[Journal], None]) -> None:
+        if self._journal is None:
+            return
+        try:
+            update(self._journal)
+        except OSError:
+            self._logger.error("Error writing the progress journal!", exc_info=True)
+            self._logger.error(f"{self.journal_path=}")
+
+    def _remove_journal(self) -> None:
+        if self.journal_path:
+            self._journal = self._journal or Journal(self.journal_path)
+            self._update_journal(lambda journal: journal.remove())
+
+    def resume_after_holiday(
+            self,
+            images_todo: list[str],
+            images_done: list[str],
+            jobs_todo: dict[str, list[int]] | None = None) -> None:
+        with self._progress_lock:
+            self._images_todo = {image_path: (jobs_todo or {}).get(image_path) for image_path in images_todo}
+            self._images_done = images_done.copy()
+            self._images_failed = []
+            self._images_skipped = []
         self._state = MarkerState.PAUSED
-        if self.watermark_path:
-            self.preview_image_base64 = self._get_marked_image_base64(self.images_done[-1])
+        if (self.jobs or self.output_folder) and images_done:
+            marked_image_path = self.get_marked_image_path(images_done[-1])
+            if Path(marked_image_path).exists():
+                self._latest_marked_image_path = marked_image_path
+
+    def _get_executor(self) -> Executor | Pipeline:
+        executor_key = (self.engine, self._max_workers)
+        if self.engine == "pipeline":
+            executor_key += tuple(self.stage_workers.items())
+        elif self.engine == "process":
+            for watermark_path in dict.fromkeys(job.watermark_path for job in self._get_jobs()):
+                watermark_stat = os.stat(watermark_path)
+                executor_key += (os.path.abspath(watermark_path), watermark_stat.st_mtime_ns, watermark_stat.st_size)
+            executor_key += (self.max_image_pixels, self._watermark_cache.max_entries)
+
+        # A pool whose worker process died, e.g. killed when out of memory, can't run anything anymore
+        if self._executor is None or executor_key != self._executor_key or getattr(self._executor, "_broken", False):
+            self.shutdown()
+            self._executor = self._create_executor()
+            self._executor_key = executor_key
+        return self._executor
+
+    def _create_executor(self) -> Executor | Pipeline:
+        if self.engine == "pipeline":
+            return Pipeline(self.stage_workers)
+        if self.engine == "process":
+            watermarks = {}
+            for watermark_path in dict.fromkeys(job.watermark_path for job in self._get_jobs()):
+                with open(watermark_path, "rb") as watermark_file:
+                    watermarks[watermark_path] = watermark_file.read()
+            # Forking the threads of this process can copy locks some thread holds, which then never get released
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            return ProcessPoolExecutor(
+                max_workers=self._max_workers,
+                mp_context=multiprocessing.get_context(start_method),
+                initializer=_init_process_worker,
+                initargs=(watermarks, self.max_image_pixels, self._watermark_cache.max_entries)
+            )
+        return ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="marker")
+
+    def shutdown(self, wait: bool = False) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+            self._executor_key = None
+
+    def _submit(self, executor: Executor | Pipeline, image_path: str) -> Future:
+        outputs = self._get_rendition_outputs(image_path, self._get_image_jobs(image_path))
+        if self.engine == "pipeline":
+            # Every stage of one image runs after the previous one, so they can share the metrics without a lock
+            metrics = ImageMetrics()
+            return executor.submit([
+                ("read", self._profiled(partial(Marker._read_image, image_path, metrics))),
+                ("compose", self._profiled(partial(
+                    Marker._compose_image,
+                    metrics=metrics,
+                    image_path=image_path,
+                    outputs=outputs,
+                    watermark_cache=self._watermark_cache,
+                    compositor=self.compositor
+                ))),
+                ("encode", self._profiled(partial(Marker._encode_image, metrics=metrics))),
+                ("write", self._profiled(partial(
+                    Marker._write_image, metrics=metrics, image_path=image_path, outputs=outputs
+                )))
+            ])
+        if self.engine == "process":
+            return executor.submit(_place_mark_and_save_in_process, image_path, outputs, self.compositor)
+        return executor.submit(
+            self._profiled(Marker._place_mark_and_save), image_path, outputs, self._watermark_cache, self.compositor
+        )
 
     def _run(self) -> None:
-        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
-            futures: list[Future] = [executor.submit(
-                Marker._place_mark_and_save,
-                image,
-                self.watermark_path,
-                self.output_folder,
-                self.name_extension,
-                self.padding_around_watermarks,
-                self.padding_between_watermarks,
-                self._logger
-            ) for image in self._images_todo]
-
-            marked_image_base64 = self.preview_image_base64
-            while futures:
-                sleep(self.UPDATE_INTERVAL)
-
-                if self.state in [MarkerState.PAUSING, MarkerState.CANCELING]:
-                    executor.shutdown(wait=True, cancel_futures=True)
-
-                finished_futures = []
-                for future in futures:
-                    if future.done() and not future.cancelled():
-                        finished_futures.append(future)
-                        marked_image_base64, _, image_path = future.result()
-                        self._images_done.append(image_path)
-                        self._images_todo.remove(image_path)
-                [futures.remove(finished_future) for finished_future in finished_futures]
-                self.preview_image_base64 = marked_image_base64
-
-                if self.state == MarkerState.PAUSING:
-                    self._state = MarkerState.PAUSED
-                    return
-                elif not self._images_todo or self.state == MarkerState.CANCELING:
-                    self._state = MarkerState.IDLE
-                    return
+        # Every job and rendition of an image needs its own scaled watermark, with fewer entries they would evict each
+        # other image after image. The overlays built from them are only limited by their bytes.
+        self._watermark_cache.max_entries = max(
+            self._watermark_cache.max_entries, 2 * len(self._get_jobs()) * len(self._get_renditions())
+        )
+        in_flight: dict[Future, tuple[str, int]] = {}
+        completed = self._completed
+        layout_plan, self._layout_plan = self._layout_plan, None
+        image_headers = {image_path: image_header for image_header, image_paths in
+                         layout_plan.image_groups.items() for image_path in image_paths} if layout_plan else {}
+        next_image: tuple[str, int] | None = None
+        self._preview_rendered_path = None
+        # noinspection PyBroadException
+        try:
+            executor = self._get_executor()
+            self._claims = ClaimFolder(self.get_claims_folder(), self.claim_timeout) if self.work_stealing else None
+            pending_images = filter(self._claim, chain(self.images_todo, self._discover()))
+            governor = self._create_governor()
+            if layout_plan and self.engine != "process":
+                # noinspection PyBroadException
+                try:
+                    self._prewarm_overlays(layout_plan)
+                except Exception:
+                    self._logger.error("Error preparing watermarks!", exc_info=True)
+            while True:
+                if self.state == MarkerState.RUNNING:
+                    while next_image or (image_path := next(pending_images, None)):
+                        next_image = next_image or (
+                            image_path, self._estimate_cost(image_path, image_headers, governor)
+                        )
+                        if not governor.can_admit(next_image[1]):
+                            break
+                        governor.admit(next_image[1])
+                        try:
+                            future = self._submit(executor, next_image[0])
+                        except BrokenExecutor:
+                            # The images in the broken pool fail, the others are marked by a new one
+                            self._logger.error("Worker pool broke, starting a new one!", exc_info=True)
+                            executor = self._get_executor()
+                            future = self._submit(executor, next_image[0])
+                        in_flight[future] = next_image
+                        next_image = None
+                        future.add_done_callback(completed.put)
+                if not in_flight:
+                    break
+
+                future = completed.get()
+                if future is None:
+                    # Workers only finish their current image, the queued ones stay to do
+                    for queued_future in list(in_flight):
+                        queued_future.cancel()
+                    continue
+                image_path, cost = in_flight.pop(future)
+                governor.release(cost)
+                marked = not future.cancelled() and self._finish_image(future, image_path)
+                self._end_claim(image_path, marked)
+        except Exception:
+            # The marker must not be left running, the images not marked yet stay to do and can be resumed
+            self._logger.error("Error running the marker!", exc_info=True)
+            for future, (image_path, _) in in_flight.items():
+                future.cancel()
+                self._end_claim(image_path, False)
+            self.shutdown()
+            self._state = MarkerState.PAUSING
+
+        if next_image:
+            self._end_claim(next_image[0], False)
+        self._save_manifests()
+        self._run_stats.stop()
+        self._stop_profiler()
+        if self.state == MarkerState.PAUSING and (self._images_todo or self._discovery is not None):
+            self._update_journal(lambda journal: journal.close())
+            self._state = MarkerState.PAUSED
+        else:
+            self._discovery = None
+            self._remove_journal()
+            self._state = MarkerState.IDLE
+
+    def _create_governor(self) -> ConcurrencyGovernor:
+        return ConcurrencyGovernor(
+            self.max_in_flight,
+            self.memory_limit,
+            include_children=self.engine == "process",
+            max_overlay_bytes=self._watermark_cache.max_overlay_bytes,
+            # Every worker process builds its own overlays
+            overlay_copies=self._max_workers if self.engine == "process" else 1
+        )
+
+    def _estimate_cost(
+            self,
+            image_path: str,
+            image_headers: dict[str, tuple[int, int, str]],
+            governor: ConcurrencyGovernor) -> int:
+        if self.memory_limit is None:
+            return 0
+        if image_path not in image_headers:
+            try:
+                with Image.open(image_path) as image:
+                    image_headers[image_path] = (*image.size, image.mode)
+            except (OSError, Image.DecompressionBombError):
+                # The worker reports the error, it doesn't need memory for that
+                return 0
+        width, height, mode = image_headers.pop(image_path)
+        bands = Image.getmodebands(mode)
+        cost = governor.estimate_cost((width, height), bands)
+        jobs = self._get_jobs()
+        rendition_sizes = self._get_rendition_sizes((width, height))
+        # Every job and rendition is an image of its own, except for one full size output that marks the decoded image
+        if (width, height) in rendition_sizes:
+            cost -= width * height * bands
+        for job_index in self._get_image_jobs(image_path):
+            for rendition_width, rendition_height in rendition_sizes:
+                cost += rendition_width * rendition_height * bands
+                if rendition_width * rendition_height >= LARGE_IMAGE_PIXELS:
+                    # No cached overlay, but the scaled watermark of a single image can be about as big as the image
+                    cost += rendition_width * rendition_height * 4
+                else:
+                    governor.reserve_overlay((rendition_width, rendition_height), jobs[job_index].watermark_path)
+        return cost
+
+    def _discover(self) -> Iterator[str]:
+        while self._discovery is not None:
+            image_path = next(self._discovery, None)
+            if image_path is None:
+                self._discovery = None
+                self._update_journal(lambda journal: journal.finish_discovery())
+                return
+            if not self._is_in_shard(image_path):
+                continue
+            job_indices = self._get_jobs_todo(image_path, self._output_settings) if self.incremental else None
+            if job_indices == []:
+                continue
+            with self._progress_lock:
+                self._images_todo[image_path] = job_indices
+            self._update_journal(lambda journal: journal.append_todo(image_path, job_indices))
+            yield image_path
+
+    def _save_manifests(self) -> None:
+        for output_folder in self._get_output_folders():
+            # noinspection PyBroadException
+            try:
+                self._get_manifest(output_folder).save()
+            except Exception:
+                self._logger.error("Error saving the manifest!", exc_info=True)
+                self._logger.error(f"{output_folder=}")
+
+    def _is_in_shard(self, image_path: str) -> bool:
+        return self.shard is None or is_in_shard(get_image_key(image_path, self.source_folder), self.shard)
+
+    def get_claims_folder(self) -> str:
+        return str(Path(self._get_output_folders()[0]).joinpath(CLAIMS_FOLDER_NAME))
+
+    def _claim(self, image_path: str) -> bool:
+        if self._claims is None:
+            return True
+        settings = [self._get_rendition_settings(output_settings, rendition)
+                    for output_settings in self._output_settings for rendition in self._get_renditions()]
+        claim_name = ClaimFolder.get_claim_name(get_image_key(image_path, self.source_folder), image_path, settings)
+        try:
+            claimed = self._claims.claim(claim_name)
+        except OSError:
+            self._logger.error("Error claiming image!", exc_info=True)
+            self._logger.error(f"{image_path=}")
+            claimed = False
+        if claimed:
+            self._claim_names[image_path] = claim_name
+        else:
+            with self._progress_lock:
+                del self._images_todo[image_path]
+                self._images_skipped.append(image_path)
+        return claimed
+
+    def _end_claim(self, image_path: str, marked: bool) -> None:
+        claim_name = self._claim_names.pop(image_path, None)
+        if self._claims is None or claim_name is None:
+            return
+        try:
+            # Failed images are released, so running the command again retries them
+            if marked:
+                self._claims.finish(claim_name)
+            else:
+                self._claims.release(claim_name)
+        except OSError:
+            self._logger.error("Error updating claim!", exc_info=True)
+            self._logger.error(f"{image_path=}")
+
+    def _finish_image(self, future: Future, image_path: str) -> bool:
+        jobs = self._get_jobs()
+        job_indices = self._get_image_jobs(image_path)
+        if future.exception():
+            error = "".join(traceback.format_exception(future.exception()))
+        else:
+            marked_image_paths, image_path, error, metrics = future.result()
+            if not error:
+                self._run_stats.record(metrics)
+                self._latest_marked_image_path = marked_image_paths[0]
+                # The outputs are in the order of the jobs and their renditions
+                outputs = [(job_index, rendition) for job_index in job_indices for rendition in self._get_renditions()]
+                for (job_index, rendition), marked_image_path in zip(outputs, marked_image_paths):
+                    self._get_manifest(jobs[job_index].output_folder).record(
+                        image_path,
+                        marked_image_path,
+                        self._get_rendition_settings(self._output_settings[job_index], rendition)
+                    )
+        if error:
+            watermark_paths = [jobs[job_index].watermark_path for job_index in job_indices]
+            self._logger.error(f"Error placing watermark!\n{error}")
+            self._logger.error(f"{image_path=}, {watermark_paths=}")
+
+        if self._profiler is not None:
+            self._profiler.sample_memory()
+        with self._progress_lock:
+            del self._images_todo[image_path]
+            self._images_done.append(image_path)
+            if error:
+                self._images_failed.append(image_path)
+        self._update_journal(lambda journal: journal.append_done(image_path))
+        return not error
 
     @staticmethod
-    def find_images(folder: str) -> list[str]:
-        images = []
-        for dir_entry in os.scandir(folder):
-            if dir_entry.is_file() and Path(dir_entry).suffix in [".jpg", ".png", ".jpeg"]:
-                images.append(dir_entry.path)
-        return images
-
-    def _get_marked_image_base64(self, image_path: str) -> str | None:
+    def iter_images(
+            folder: str,
+            recursive: bool = True,
+            extensions: list[str] | None = None,
+            exclude: str | list[str] | None = None,
+            on_error: Callable[[OSError], None] | None = None) -> Iterator[str]:
+        extensions = extensions or supported_image_extensions()
+        excluded_folders = [exclude] if isinstance(exclude, str) else exclude or []
+        try:
+            with os.scandir(folder) as dir_entries:
+                dir_entries = sorted(dir_entries, key=lambda dir_entry: dir_entry.name)
+        except OSError as e:
+            # Like os.walk, a folder that can't be listed, e.g. without permission on a share, is skipped
+            if on_error is not None:
+                on_error(e)
+            return
+        for dir_entry in dir_entries:
+            if dir_entry.is_file() and Path(dir_entry).suffix.lower() in extensions:
+                yield dir_entry.path
+            elif recursive and dir_entry.is_dir(follow_symlinks=False) and os.path.abspath(dir_entry.path) not in [
+                    os.path.abspath(excluded_folder) for excluded_folder in excluded_folders]:
+                yield from Marker.iter_images(dir_entry.path, recursive, extensions, excluded_folders, on_error)
+
+    @staticmethod
+    def find_images(
+            folder: str,
+            recursive: bool = True,
+            exclude: str | None = None,
+            on_error: Callable[[OSError], None] | None = None) -> list[str]:
+        return list(Marker.iter_images(folder, recursive, exclude=exclude, on_error=on_error))
+
+    def log_discovery_error(self, error: OSError) -> None:
+        self._logger.error(f"Error looking for images, skipping the folder! {error}")
+
+    def _get_thumbnail_base64(self, image_path: str) -> str | None:
         # noinspection PyBroadException
         try:
-            with self._get_marked_image(
-                    image_path, self.watermark_path, self.padding_around_watermarks, self.padding_between_watermarks
-            ) as image:
-                image_base64 = self.convert_to_base64(image)
-                return image_base64
+            with Image.open(image_path) as image:
+                image.thumbnail(self.preview_size)
+                return self.convert_to_base64(image)
         except Exception:
-            self._logger.error("Error placing watermark!", exc_info=True)
-            self._logger.error(f"{image_path=}, {self.watermark_path=}")
+            self._logger.error("Error loading preview!", exc_info=True)
+            self._logger.error(f"{image_path=}")
             return None
 
     @staticmethod
     def _place_mark_and_save(
             image_path: str,
-            watermark_path: str,
-            output_dir: str,
-            name_extension: str,
-            padding_around: int,
-            padding_between: int,
-            logger: logging.Logger) -> (str, str, str):
+            outputs: list[RenditionOutput],
+            watermark_cache: WatermarkCache,
+            compositor: str = "pillow") -> (list[str], str, str | None, ImageMetrics):
+        metrics = ImageMetrics()
         # noinspection PyBroadException
         try:
-            with Marker._get_marked_image(image_path, watermark_path, padding_around, padding_between) as marked_image:
-                marked_image_path = Marker._save_image(marked_image, output_dir, name_extension)
-                marked_image_base64 = Marker.convert_to_base64(marked_image)
+            with metrics.time("open"):
+                image = Image.open(image_path)
+            with image:
+                image_size = Marker._load_image(image, outputs, metrics)
+                metrics.bytes_read = os.path.getsize(image_path)
+                for marked_image, output in Marker._iter_marked_renditions(
+                        image, image_size, outputs, watermark_cache, image_path, compositor, metrics):
+                    Marker._save_image(marked_image, output.marked_image_path, output.encoder_profile, metrics)
+                    if marked_image is not image:
+                        marked_image.close()
+            marked_image_paths = [output.marked_image_path for output in outputs]
+            error = None
         except Exception:
-            if marked_image:
-                marked_image.close()
-            logger.error("Error placing watermark!", exc_info=True)
-            logger.error(f"{image_path=}, {watermark_path=}")
-            marked_image_base64 = ""
-            marked_image_path = ""
-        return marked_image_base64, marked_image_path, image_path
+            marked_image_paths = []
+            error = traceback.format_exc()
+        return marked_image_paths, image_path, error, metrics
 
     @staticmethod
-    def _save_image(image: ImageFile, output_dir: str, name_extension: str) -> str:
-        marked_file_name = f"{Path(image.filename).stem}{name_extension}{Path(image.filename).suffix}"
-        marked_file_path = Path(output_dir).joinpath(marked_file_name)
-        image.save(marked_file_path)
-        return str(marked_file_path)
+    def _load_image(image: ImageFile, outputs: list[RenditionOutput], metrics: ImageMetrics) -> tuple[int, int]:
+        image_size = image.size
+        with metrics.time("open"):
+            if all(output.max_size for output in outputs):
+                # Without a full size rendition JPEGs decode straight to a fraction of their size, kept at least twice
+                # as big as the largest rendition like Pillow's thumbnails do
+                width, height = get_rendition_size(image_size, max(output.max_size for output in outputs))
+                image.draft(None, (2 * width, 2 * height))
+            image.load()
+        return image_size
 
     @staticmethod
-    def _get_marked_image(
-            image_path: str, watermark_path: str, padding_around: int, padding_between: int) -> ImageFile:
-        image = Image.open(image_path)
-        with Image.open(watermark_path) as watermark:
-            watermark_scaled_width = image.width - 2 * padding_around
-            ratio_width = watermark_scaled_width / watermark.width
-            watermark_scaled_height = int(watermark.height * ratio_width)
-            stack_vertically = True
-
-            if (watermark_scaled_height + 2 * padding_around) > image.height:
-                stack_vertically = False
-                watermark_scaled_height = image.height - 2 * padding_around
-                ratio_height = watermark_scaled_height / watermark.height
-                watermark_scaled_width = int(watermark.width * ratio_height)
-
-            if watermark_scaled_height < 1 or watermark_scaled_width < 1:
-                raise MarkerRunError(
-                    f"Watermark is to small to be fitted after rescaling. Padding is probably to big.\n"
-                    f"{padding_around=}, {padding_between=}, {image_path}"
-                )
-
-            watermark = watermark.resize(
-                (watermark_scaled_width, watermark_scaled_height), resample=Resampling.LANCZOS
+    def _iter_marked_renditions(
+            image: Image.Image,
+            image_size: tuple[int, int],
+            outputs: list[RenditionOutput],
+            watermark_cache: WatermarkCache,
+            image_path: str,
+            compositor: str,
+            metrics: ImageMetrics) -> Iterator[tuple[Image.Image, RenditionOutput]]:
+        # Every size is resized once from the unmarked image and copied for all but the last job marking it. The full
+        # size outputs come last, so the very last one marks the decoded image itself.
+        sized_outputs = sorted(
+            ((get_rendition_size(image_size, output.max_size), output) for output in outputs),
+            key=lambda sized_output: (sized_output[0] == image_size, sized_output[0])
+        )
+        unmarked_image = None
+        for index, (rendition_size, output) in enumerate(sized_outputs):
+            if unmarked_image is None or unmarked_image.size != rendition_size:
+                if rendition_size == image.size:
+                    unmarked_image = image
+                else:
+                    with metrics.time("resize"):
+                        unmarked_image = image.resize(rendition_size, Resampling.LANCZOS, reducing_gap=3.0)
+            if index + 1 < len(sized_outputs) and sized_outputs[index + 1][0] == rendition_size:
+                with metrics.time("resize"):
+                    marked_image = unmarked_image.copy()
+            else:
+                marked_image = unmarked_image
+            Marker._place_watermark(
+                marked_image,
+                output.watermark_path,
+                get_rendition_padding(output.padding_around, image_size, rendition_size),
+                get_rendition_padding(output.padding_between, image_size, rendition_size),
+                watermark_cache,
+                image_path,
+                compositor,
+                metrics
             )
+            yield marked_image, output
 
-            if stack_vertically:
-                repeats = int(
-                    (image.height - 2 * padding_around + padding_between) / (watermark_scaled_height + padding_between)
-                )
-                offset = (image.height - (repeats * (watermark_scaled_height + padding_between) - padding_between)) // 2
-            else:
-                repeats = int(
-                    (image.width - 2 * padding_around + padding_between) / (watermark_scaled_width + padding_between)
-                )
-                offset = (image.width - (repeats * (watermark_scaled_width + padding_between) - padding_between)) // 2
+    @staticmethod
+    def _read_image(image_path: str, metrics: ImageMetrics, _=None) -> bytes | str:
+        with metrics.time("open"):
+            with Image.open(image_path) as image:
+                if image.width * image.height >= LARGE_IMAGE_PIXELS:
+                    # Large images are decoded straight from the file, not from a copy of it in memory
+                    metrics.bytes_read = os.path.getsize(image_path)
+                    return image_path
+            image_data = Path(image_path).read_bytes()
+        metrics.bytes_read = len(image_data)
+        return image_data
 
-            if repeats < 1:
-                raise MarkerRunError(
-                    f"Could not fit watermark on image. Padding is probably to big.\n"
-                    f"{padding_around=}, {padding_between=}, {image_path}"
+    @staticmethod
+    def _compose_image(
+            image_data: bytes | str,
+            metrics: ImageMetrics,
+            image_path: str,
+            outputs: list[RenditionOutput],
+            watermark_cache: WatermarkCache,
+            compositor: str = "pillow") -> list[tuple[Image.Image, RenditionOutput]]:
+        with metrics.time("open"):
+            image = Image.open(io.BytesIO(image_data) if isinstance(image_data, bytes) else image_data)
+        image_size = Marker._load_image(image, outputs, metrics)
+        marked_images = list(Marker._iter_marked_renditions(
+            image, image_size, outputs, watermark_cache, image_path, compositor, metrics
+        ))
+        if all(marked_image is not image for marked_image, _ in marked_images):
+            image.close()
+        return marked_images
+
+    @staticmethod
+    def _encode_image(
+            marked_images: list[tuple[Image.Image, RenditionOutput]],
+            metrics: ImageMetrics) -> list[tuple[bytes | Image.Image, RenditionOutput]]:
+        encoded_images = []
+        for marked_image, output in marked_images:
+            if marked_image.width * marked_image.height >= LARGE_IMAGE_PIXELS:
+                # Large images are encoded straight into their file by the write stage, not into memory first
+                encoded_images.append((marked_image, output))
+                continue
+            with marked_image, metrics.time("encode"):
+                encoded_images.append(
+                    (encode_image(marked_image, output.marked_image_path, output.encoder_profile), output)
                 )
+        return encoded_images
 
-            for repeat in range(repeats):
-                if stack_vertically:
-                    position = (padding_around, offset + repeat * (watermark_scaled_height + padding_between))
-                else:
-                    position = (offset + repeat * (watermark_scaled_width + padding_between), padding_around)
-                image.paste(watermark, position, watermark)
+    @staticmethod
+    def _write_image(
+            encoded_images: list[tuple[bytes | Image.Image, RenditionOutput]],
+            metrics: ImageMetrics,
+            image_path: str,
+            outputs: list[RenditionOutput]) -> (list[str], str, str | None, ImageMetrics):
+        for image_data, output in encoded_images:
+            if isinstance(image_data, Image.Image):
+                with image_data:
+                    Marker._save_image(image_data, output.marked_image_path, output.encoder_profile, metrics)
+                continue
+            with metrics.time("save"):
+                Path(output.marked_image_path).parent.mkdir(parents=True, exist_ok=True)
+                write_file_atomically(output.marked_image_path, image_data)
+            metrics.bytes_written += len(image_data)
+        return [output.marked_image_path for output in outputs], image_path, None, metrics
+
+    def _get_jobs(self, output_folder: str | None = None) -> list[WatermarkJob]:
+        return self.jobs or [WatermarkJob(
+            self.watermark_path,
+            output_folder or self.output_folder,
+            self.padding_around_watermarks,
+            self.padding_between_watermarks
+        )]
+
+    def _get_output_folders(self) -> list[str]:
+        return [job.output_folder for job in self._get_jobs()]
+
+    def _get_image_jobs(self, image_path: str) -> list[int]:
+        with self._progress_lock:
+            job_indices = self._images_todo.get(image_path)
+        return list(range(len(self._get_jobs()))) if job_indices is None else job_indices
+
+    def _get_partial_jobs_todo(self) -> dict[str, list[int]]:
+        with self._progress_lock:
+            return {image_path: job_indices for image_path, job_indices in self._images_todo.items()
+                    if job_indices is not None}
+
+    def _get_renditions(self) -> list[Rendition]:
+        return self.renditions or [Rendition()]
+
+    def _get_rendition_sizes(self, image_size: tuple[int, int]) -> list[tuple[int, int]]:
+        return [get_rendition_size(image_size, rendition.max_size) for rendition in self._get_renditions()]
+
+    def _get_rendition_target(self, rendition: Rendition) -> tuple[str, str, str]:
+        output_format = rendition.output_format or self.output_format
+        return os.path.normpath(rendition.subfolder or "."), rendition.name_suffix, output_format
+
+    def _get_rendition_path(self, image_path: str, output_folder: str, rendition: Rendition) -> str:
+        return self._get_marked_image_path(
+            image_path,
+            str(Path(output_folder).joinpath(rendition.subfolder)),
+            self.name_extension + rendition.name_suffix,
+            self.source_folder,
+            rendition.output_format or self.output_format
+        )
+
+    def _get_rendition_outputs(self, image_path: str, job_indices: list[int]) -> list[RenditionOutput]:
+        jobs = self._get_jobs()
+        return [
+            RenditionOutput(
+                self._get_rendition_path(image_path, jobs[job_index].output_folder, rendition),
+                rendition.max_size,
+                rendition.encoder_profile or self.encoder_profile,
+                jobs[job_index].watermark_path,
+                jobs[job_index].padding_around,
+                jobs[job_index].padding_between
+            ) for job_index in job_indices for rendition in self._get_renditions()
+        ]
 
+    def get_marked_image_paths(self, image_path: str) -> list[str]:
+        return [self._get_rendition_path(image_path, job.output_folder, rendition)
+                for job in self._get_jobs() for rendition in self._get_renditions()]
+
+    def get_marked_image_path(self, image_path: str) -> str:
+        return self.get_marked_image_paths(image_path)[0]
+
+    @staticmethod
+    def _get_marked_image_path(
+            image_path: str,
+            output_dir: str,
+            name_extension: str,
+            source_folder: str | None = None,
+            output_format: str = "keep") -> str:
+        suffix = OUTPUT_FORMATS[output_format] or Path(image_path).suffix
+        marked_file_name = f"{Path(image_path).stem}{name_extension}{suffix}"
+        marked_file_dir = Path(output_dir)
+        if source_folder:
+            try:
+                marked_file_dir = marked_file_dir.joinpath(Path(image_path).parent.relative_to(source_folder))
+            except ValueError:
+                pass
+        return str(marked_file_dir.joinpath(marked_file_name))
+
+    @staticmethod
+    def _save_image(image: ImageFile, marked_image_path: str, encoder_profile: str, metrics: ImageMetrics) -> None:
+        if image.width * image.height >= LARGE_IMAGE_PIXELS:
+            with metrics.time("save"):
+                Path(marked_image_path).parent.mkdir(parents=True, exist_ok=True)
+                save_image(image, marked_image_path, encoder_profile)
+            metrics.bytes_written += os.path.getsize(marked_image_path)
+            return
+        # Encoding into memory first tells the time spent compressing apart from the time the disk takes
+        with metrics.time("encode"):
+            image_data = encode_image(image, marked_image_path, encoder_profile)
+        with metrics.time("save"):
+            Path(marked_image_path).parent.mkdir(parents=True, exist_ok=True)
+            write_file_atomically(marked_image_path, image_data)
+        metrics.bytes_written += len(image_data)
+
+    @staticmethod
+    def _get_marked_image(
+            image_path: str,
+            watermark_path: str,
+            padding_around: int,
+            padding_between: int,
+            watermark_cache: WatermarkCache,
+            compositor: str = "pillow",
+            metrics: ImageMetrics | None = None) -> ImageFile:
+        metrics = metrics or ImageMetrics()
+        with metrics.time("open"):
+            image = Image.open(image_path)
+            image.load()
+        metrics.bytes_read = os.path.getsize(image_path)
+        Marker._place_watermark(
+            image, watermark_path, padding_around, padding_between, watermark_cache, image_path, compositor, metrics
+        )
         return image
 
+    @staticmethod
+    def _place_watermark(
+            image: Image.Image,
+            watermark_path: str,
+            padding_around: int,
+            padding_between: int,
+            watermark_cache: WatermarkCache,
+            image_path: str,
+            compositor: str = "pillow",
+            metrics: ImageMetrics | None = None) -> None:
+        metrics = metrics or ImageMetrics()
+        with metrics.time("watermark"):
+            watermark = watermark_cache.get_source(watermark_path)
+            layout = Marker._get_layout(image.size, watermark.size, padding_around, padding_between, image_path)
+        if image.width * image.height >= LARGE_IMAGE_PIXELS:
+            Marker._place_watermark_tiles(image, watermark, layout, compositor, metrics)
+            return
+        with metrics.time("watermark"):
+            overlay = watermark_cache.get_overlay(watermark_path, layout)
+        with metrics.time("composite"):
+            COMPOSITORS[compositor](image, overlay, layout.overlay_position)
+
+    @staticmethod
+    def _place_watermark_tiles(
+            image: Image.Image,
+            watermark: Image.Image,
+            layout: WatermarkLayout,
+            compositor: str,
+            metrics: ImageMetrics) -> None:
+        # An overlay as large as the image would be built for this one image only and evict every other overlay from
+        # the cache. Tiles never overlap and the blend is per pixel, so pasting the scaled watermark, resized the same
+        # way as for the overlay, at every tile position gives the same pixels.
+        with metrics.time("watermark"):
+            scaled_watermark = watermark.resize(layout.watermark_size, resample=Resampling.LANCZOS)
+        overlay_x, overlay_y = layout.overlay_position
+        with metrics.time("composite"), scaled_watermark:
+            for tile_x, tile_y in layout.tile_positions():
+                COMPOSITORS[compositor](image, scaled_watermark, (overlay_x + tile_x, overlay_y + tile_y))
+
+    @staticmethod
+    def _get_layout(
+            image_size: tuple[int, int],
+            watermark_size: tuple[int, int],
+            padding_around: int,
+            padding_between: int,
+            image_path: str) -> WatermarkLayout:
+        image_width, image_height = image_size
+        watermark_width, watermark_height = watermark_size
+        watermark_scaled_width = image_width - 2 * padding_around
+        ratio_width = watermark_scaled_width / watermark_width
+        watermark_scaled_height = int(watermark_height * ratio_width)
+        stack_vertically = True
+
+        if (watermark_scaled_height + 2 * padding_around) > image_height:
+            stack_vertically = False
+            watermark_scaled_height = image_height - 2 * padding_around
+            ratio_height = watermark_scaled_height / watermark_height
+            watermark_scaled_width = int(watermark_width * ratio_height)
+
+        if watermark_scaled_height < 1 or watermark_scaled_width < 1:
+            raise MarkerRunError(
+                f"Watermark is to small to be fitted after rescaling. Padding is probably to big.\n"
+                f"{padding_around=}, {padding_between=}, {image_path}"
+            )
+
+        if stack_vertically:
+            repeats = int(
+                (image_height - 2 * padding_around + padding_between) / (watermark_scaled_height + padding_between)
+            )
+            offset = (image_height - (repeats * (watermark_scaled_height + padding_between) - padding_between)) // 2
+        else:
+            repeats = int(
+                (image_width - 2 * padding_around + padding_between) / (watermark_scaled_width + padding_between)
+            )
+            offset = (image_width - (repeats * (watermark_scaled_width + padding_between) - padding_between)) // 2
+
+        if repeats < 1:
+            raise MarkerRunError(
+                f"Could not fit watermark on image. Padding is probably to big.\n"
+                f"{padding_around=}, {padding_between=}, {image_path}"
+            )
+
+        return WatermarkLayout(
+            (watermark_scaled_width, watermark_scaled_height),
+            stack_vertically,
+            repeats,
+            offset,
+            padding_around,
+            padding_between
+        )
+
     @staticmethod
     def convert_to_base64(image: ImageFile) -> str:
         buffered = io.BytesIO()
         image.save(buffered, image.format.lower())
         return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+_process_watermark_cache: WatermarkCache | None = None
+
+
+def _init_process_worker(watermarks: dict[str, bytes], max_image_pixels: int | None, max_cache_entries: int) -> None:
+    global _process_watermark_cache
+    Image.MAX_IMAGE_PIXELS = max_image_pixels
+    _process_watermark_cache = WatermarkCache(max_entries=max_cache_entries)
+    for watermark_path, watermark_bytes in watermarks.items():
+        _process_watermark_cache.prime(watermark_path, watermark_bytes)
+
+
+def _place_mark_and_save_in_process(
+        image_path: str, outputs: list[RenditionOutput], compositor: str) -> (list[str], str, str | None, ImageMetrics):
+    return Marker._place_mark_and_save(image_path, outputs, _process_watermark_cache, compositor)
@@ -0,0 +1,60 @@
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+PIPELINE_STAGES = ["read", "compose", "encode", "write"]
+
+PipelineStages = list[tuple[str, Callable[[Any], Any]]]
+
+
+class Pipeline:
+
+    def __init__(self, stage_workers: dict[str, int]) -> None:
+        self._executors = {
+            stage: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"marker-{stage}")
+            for stage, workers in stage_workers.items()
+        }
+
+    def submit(self, stages: PipelineStages, value: Any = None) -> Future:
+        result = Future()
+        self._submit_stage(result, stages, 0, value)
+        return result
+
+    def _submit_stage(self, result: Future, stages: PipelineStages, index: int, value: Any) -> None:
+        stage, function = stages[index]
+        try:
+            future = self._executors[stage].submit(
+                partial(self._run_stage, result, function, index + 1 == len(stages)), value
+            )
+        except RuntimeError:
+            # The pipeline has been shut down while the image was in an earlier stage
+            self._abort(result)
+            return
+        future.add_done_callback(lambda done_future: self._on_stage_done(result, stages, index, done_future))
+
+    @staticmethod
+    def _run_stage(result: Future, function: Callable[[Any], Any], last_stage: bool, value: Any) -> Any:
+        # An image can be cancelled until its last stage starts, the stages left of a cancelled one are skipped
+        started = result.set_running_or_notify_cancel() if last_stage else not result.cancelled()
+        return function(value) if started else None
+
+    @staticmethod
+    def _abort(result: Future) -> None:
+        if not result.cancel():
+            result.set_exception(CancelledError())
+
+    def _on_stage_done(self, result: Future, stages: PipelineStages, index: int, future: Future) -> None:
+        if result.cancelled():
+            return
+        if future.cancelled():
+            self._abort(result)
+        elif future.exception():
+            result.set_exception(future.exception())
+        elif index + 1 == len(stages):
+            result.set_result(future.result())
+        else:
+            self._submit_stage(result, stages, index + 1, future.result())
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait, cancel_futures=cancel_futures)
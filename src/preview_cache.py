@@ -0,0 +1,81 @@
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+
+
+class PreviewCache:
+
+    def __init__(
+            self, max_bytes: int = 64 * 1024 * 1024, cache_dir: str | None = None,
+            max_disk_bytes: int = 256 * 1024 * 1024) -> None:
+        self._max_bytes = max_bytes
+        self._cache_dir = Path(cache_dir) if cache_dir else None
+        self._max_disk_bytes = max_disk_bytes
+        self._lock = Lock()
+        self._previews: OrderedDict[tuple, str] = OrderedDict()
+        self._bytes = 0
+
+        if self._cache_dir:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _disk_path(self, key: tuple) -> Path:
+        return self._cache_dir.joinpath(f"{hashlib.sha256(repr(key).encode('utf-8')).hexdigest()}.b64")
+
+    def get(self, key: tuple) -> str | None:
+        with self._lock:
+            if key in self._previews:
+                self._previews.move_to_end(key)
+                return self._previews[key]
+
+        if self._cache_dir:
+            disk_path = self._disk_path(key)
+            try:
+                preview_base64 = disk_path.read_text(encoding="ascii")
+                os.utime(disk_path)
+            except OSError:
+                return None
+            self._put_in_memory(key, preview_base64)
+            return preview_base64
+        return None
+
+    def put(self, key: tuple, preview_base64: str) -> None:
+        self._put_in_memory(key, preview_base64)
+
+        if self._cache_dir:
+            disk_path = self._disk_path(key)
+            temp_path = disk_path.with_suffix(".tmp")
+            try:
+                temp_path.write_text(preview_base64, encoding="ascii")
+                os.replace(temp_path, disk_path)
+                self._prune_disk()
+            except OSError:
+                temp_path.unlink(missing_ok=True)
+
+    def _put_in_memory(self, key: tuple, preview_base64: str) -> None:
+        with self._lock:
+            if key in self._previews:
+                self._bytes -= len(self._previews.pop(key))
+            self._previews[key] = preview_base64
+            self._bytes += len(preview_base64)
+            while self._bytes > self._max_bytes and len(self._previews) > 1:
+                _, evicted = self._previews.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def _prune_disk(self) -> None:
+        entries = sorted(
+            (stat.st_mtime_ns, stat.st_size, entry)
+            for entry in self._cache_dir.glob("*.b64") for stat in [entry.stat()]
+        )
+        disk_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry in entries[:-1]:
+            if disk_bytes <= self._max_disk_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            disk_bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._previews.clear()
+            self._bytes = 0
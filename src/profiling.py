@@ -0,0 +1,157 @@
+import cProfile
+import io
+import pstats
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from threading import Lock, local
+from typing import Callable
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PROFILING_ENVIRONMENT_VARIABLE = "WATERMARKER_PROFILE"
+PROFILING_MODES = ["cpu", "memory"]
+
+# From Python 3.12 on cProfile hooks into sys.monitoring, which allows one active profiler that sees every thread
+_PROFILER_SEES_ALL_THREADS = sys.version_info >= (3, 12)
+
+
+def parse_profiling_modes(value: str | None) -> list[str]:
+    if not value:
+        return []
+    if value.lower() in ["1", "true", "all"]:
+        return PROFILING_MODES.copy()
+    modes = [mode.strip().lower() for mode in value.split(",")]
+    if unknown_modes := [mode for mode in modes if mode not in PROFILING_MODES]:
+        raise ValueError(f"Unknown profiling modes {', '.join(unknown_modes)}, use {', '.join(PROFILING_MODES)}")
+    return modes
+
+
+class RunProfiler:
+
+    def __init__(
+            self, output_folder: str, modes: list[str], memory_frames: int = 10, memory_interval: float = 1.0) -> None:
+        self.output_folder = Path(output_folder)
+        self.profile_cpu = "cpu" in modes
+        self.trace_memory = "memory" in modes
+        self._memory_frames = memory_frames
+        self._memory_interval = memory_interval
+        self._lock = Lock()
+        self._profiles: list[cProfile.Profile] = []
+        self._thread_profile = local()
+        self._main_profile: cProfile.Profile | None = None
+        self._memory_snapshots: dict[str, tracemalloc.Snapshot] = {}
+        self._peak_memory = 0
+        self._last_memory_sample = 0.0
+        self._started_tracemalloc = False
+        self._name = ""
+
+    def start(self) -> None:
+        self._name = f"watermarker-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        if self.profile_cpu and _PROFILER_SEES_ALL_THREADS:
+            self._main_profile = cProfile.Profile()
+            try:
+                self._main_profile.enable()
+                self._profiles.append(self._main_profile)
+            except ValueError:
+                # Another profiler or debugger already uses sys.monitoring
+                self._main_profile = None
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self._memory_frames)
+                self._started_tracemalloc = True
+            tracemalloc.reset_peak()
+            self._memory_snapshots["start"] = tracemalloc.take_snapshot()
+
+    def wrap(self, function: Callable) -> Callable:
+        if not self.profile_cpu or _PROFILER_SEES_ALL_THREADS:
+            return function
+
+        @wraps(function)
+        def profiled(*args, **kwargs):
+            if getattr(self._thread_profile, "active", False):
+                return function(*args, **kwargs)
+            if not hasattr(self._thread_profile, "profile"):
+                self._thread_profile.profile = cProfile.Profile()
+                with self._lock:
+                    self._profiles.append(self._thread_profile.profile)
+            self._thread_profile.active = True
+            try:
+                return self._thread_profile.profile.runcall(function, *args, **kwargs)
+            finally:
+                self._thread_profile.active = False
+
+        return profiled
+
+    def sample_memory(self) -> None:
+        if not self.trace_memory or time.monotonic() - self._last_memory_sample < self._memory_interval:
+            return
+        self._last_memory_sample = time.monotonic()
+        current, _ = tracemalloc.get_traced_memory()
+        # Snapshots are expensive, a new one is only taken when the traced memory grew clearly beyond the last peak
+        if current > self._peak_memory * 1.1:
+            self._peak_memory = current
+            self._memory_snapshots["peak"] = tracemalloc.take_snapshot()
+
+    def stop(self) -> list[Path]:
+        if self._main_profile is not None:
+            self._main_profile.disable()
+            self._main_profile = None
+        self.output_folder.mkdir(parents=True, exist_ok=True)
+        files = []
+        if self.profile_cpu and any(profile.getstats() for profile in self._profiles):
+            files += self._dump_cpu()
+        if self.trace_memory and "start" in self._memory_snapshots:
+            files.append(self._dump_memory())
+        return files
+
+    def _dump_cpu(self) -> list[Path]:
+        with self._lock:
+            profiles = [profile for profile in self._profiles if profile.getstats()]
+        stats = pstats.Stats(*profiles)
+        prof_path = self.output_folder.joinpath(f"{self._name}.prof")
+        stats.dump_stats(prof_path)
+
+        text = io.StringIO()
+        if _PROFILER_SEES_ALL_THREADS:
+            text.write("All threads profiled together\n")
+        else:
+            text.write(f"{len(profiles)} profiled thread{'s' if len(profiles) > 1 else ''}\n")
+        stats.stream = text
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(60)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(30)
+        text_path = self.output_folder.joinpath(f"{self._name}-cpu.txt")
+        text_path.write_text(text.getvalue(), encoding="utf-8")
+        return [prof_path, text_path]
+
+    def _dump_memory(self) -> Path:
+        current, peak = tracemalloc.get_traced_memory()
+        self._memory_snapshots["end"] = tracemalloc.take_snapshot()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+        text = io.StringIO()
+        text.write(f"Traced memory at the end {current / 1_000_000:.1f} MB, peak {peak / 1_000_000:.1f} MB\n")
+        # Pillow allocates pixel data outside of Python's allocator, which tracemalloc doesn't see
+        if resource is not None:
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+            text.write(f"Peak resident memory of the process {max_rss / 1_000_000:.1f} MB\n")
+        for name, snapshot in self._memory_snapshots.items():
+            text.write(f"\nTop allocations at {name}\n")
+            for statistic in snapshot.statistics("lineno")[:25]:
+                text.write(f"{statistic}\n")
+        for name in ["peak", "end"]:
+            if name in self._memory_snapshots:
+                text.write(f"\nGrowth from start to {name}\n")
+                growth = self._memory_snapshots[name].compare_to(self._memory_snapshots["start"], "lineno")
+                for statistic in growth[:25]:
+                    text.write(f"{statistic}\n")
+        memory_path = self.output_folder.joinpath(f"{self._name}-memory.txt")
+        memory_path.write_text(text.getvalue(), encoding="utf-8")
+        return memory_path
@@ -0,0 +1,60 @@
+from dataclasses import dataclass
+
+from encoder_profiles import ENCODER_PROFILES, supported_output_formats
+
+RENDITION_KEYS = ["max", "format", "profile", "suffix", "folder"]
+
+
+@dataclass(frozen=True)
+class Rendition:
+    max_size: int | None = None
+    output_format: str | None = None
+    encoder_profile: str | None = None
+    name_suffix: str = ""
+    subfolder: str = ""
+
+
+@dataclass(frozen=True)
+class RenditionOutput:
+    marked_image_path: str
+    max_size: int | None
+    encoder_profile: str
+    watermark_path: str
+    padding_around: int
+    padding_between: int
+
+
+def parse_rendition(value: str) -> Rendition:
+    options = {}
+    for item in value.split(","):
+        key, separator, option = item.partition("=")
+        if key not in RENDITION_KEYS or not separator:
+            raise ValueError(f"Expected key=value with a key out of {', '.join(RENDITION_KEYS)}, got '{item}'")
+        options[key] = option
+    if "max" in options and (not options["max"].isdigit() or int(options["max"]) < 1):
+        raise ValueError(f"Expected the maximum width and height in pixels, got '{options['max']}'")
+    output_formats = supported_output_formats()
+    if options.get("format", "keep") not in output_formats:
+        raise ValueError(f"Unsupported output format '{options['format']}', use {', '.join(output_formats)}")
+    if options.get("profile", "default") not in ENCODER_PROFILES:
+        raise ValueError(f"Unknown encoder profile '{options['profile']}', use {', '.join(ENCODER_PROFILES)}")
+    return Rendition(
+        int(options["max"]) if "max" in options else None,
+        options.get("format"),
+        options.get("profile"),
+        options.get("suffix", ""),
+        options.get("folder", "")
+    )
+
+
+def get_rendition_size(image_size: tuple[int, int], max_size: int | None) -> tuple[int, int]:
+    width, height = image_size
+    if max_size is None or max(width, height) <= max_size:
+        return image_size
+    scale = max_size / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def get_rendition_padding(padding: int, image_size: tuple[int, int], rendition_size: tuple[int, int]) -> int:
+    # Paddings shrink with the image, the same way the preview scales them, so every rendition looks alike
+    return round(padding * rendition_size[0] / image_size[0])
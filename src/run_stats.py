@@ -0,0 +1,95 @@
+import statistics
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Iterator
+
+STAGES = ["open", "resize", "watermark", "composite", "encode", "save"]
+
+
+@dataclass
+class ImageMetrics:
+    seconds: dict[str, float] = field(default_factory=dict)
+    bytes_read: int = 0
+    bytes_written: int = 0
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - start
+
+
+@dataclass(frozen=True)
+class StageStatistics:
+    p50: float
+    p95: float
+    total: float
+
+
+@dataclass(frozen=True)
+class RunStatistics:
+    elapsed: float
+    images: int
+    images_per_second: float
+    megabytes_read_per_second: float
+    megabytes_written_per_second: float
+    eta: float | None
+    stages: dict[str, StageStatistics]
+
+
+class RunStats:
+
+    def __init__(self, max_samples: int = 10_000) -> None:
+        self._lock = Lock()
+        self._start = time.monotonic()
+        self._stop: float | None = None
+        self._images = 0
+        self._bytes_read = 0
+        self._bytes_written = 0
+        # Percentiles come from the latest samples, so a long run neither grows without bound nor hides a slowdown
+        self._samples: dict[str, deque[float]] = {stage: deque(maxlen=max_samples) for stage in STAGES}
+        self._totals: dict[str, float] = dict.fromkeys(STAGES, 0.0)
+
+    def record(self, metrics: ImageMetrics) -> None:
+        with self._lock:
+            self._images += 1
+            self._bytes_read += metrics.bytes_read
+            self._bytes_written += metrics.bytes_written
+            for stage, seconds in metrics.seconds.items():
+                self._samples[stage].append(seconds)
+                self._totals[stage] += seconds
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stop = time.monotonic()
+
+    @staticmethod
+    def _stage_statistics(samples: list[float], total: float) -> StageStatistics:
+        if len(samples) < 2:
+            return StageStatistics(samples[0] if samples else 0.0, samples[0] if samples else 0.0, total)
+        return StageStatistics(statistics.median(samples), statistics.quantiles(samples, n=20)[18], total)
+
+    def snapshot(self, images_todo: int | None) -> RunStatistics:
+        with self._lock:
+            elapsed = (self._stop or time.monotonic()) - self._start
+            images = self._images
+            bytes_read = self._bytes_read
+            bytes_written = self._bytes_written
+            samples = {stage: list(stage_samples) for stage, stage_samples in self._samples.items()}
+            totals = self._totals.copy()
+
+        images_per_second = images / elapsed if elapsed > 0 else 0.0
+        return RunStatistics(
+            elapsed,
+            images,
+            images_per_second,
+            bytes_read / elapsed / 1_000_000 if elapsed > 0 else 0.0,
+            bytes_written / elapsed / 1_000_000 if elapsed > 0 else 0.0,
+            images_todo / images_per_second if images_todo is not None and images_per_second > 0 else None,
+            {stage: self._stage_statistics(samples[stage], totals[stage]) for stage in STAGES}
+        )
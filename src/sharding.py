@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import socket
+import time
+from pathlib import Path
+
+from helpers import create_file_exclusively, remove_if_stale, write_file_atomically
+
+CLAIMS_FOLDER_NAME = ".watermarker-claims"
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    index, separator, count = value.partition("/")
+    if not separator or not index.isdigit() or not count.isdigit() or not 1 <= int(index) <= int(count):
+        raise ValueError(f"Expected the shard as INDEX/COUNT with 1 <= INDEX <= COUNT, e.g. 2/4, got '{value}'")
+    return int(index), int(count)
+
+
+def get_image_key(image_path: str, source_folder: str | None) -> str:
+    # Relative to the source folder, so machines mounting the same share at different paths agree
+    if source_folder:
+        try:
+            return Path(image_path).resolve().relative_to(Path(source_folder).resolve()).as_posix()
+        except ValueError:
+            pass
+    return Path(image_path).resolve().as_posix()
+
+
+def is_in_shard(image_key: str, shard: tuple[int, int]) -> bool:
+    # hash() is salted per process, SHA-1 gives every process and machine the same partition
+    index, count = shard
+    return int.from_bytes(hashlib.sha1(image_key.encode("utf-8")).digest()[:8], "big") % count == index - 1
+
+
+class ClaimFolder:
+
+    def __init__(self, folder: str | Path, stale_after: float = 600.0) -> None:
+        self.folder = Path(folder)
+        self.stale_after = stale_after
+
+    @staticmethod
+    def get_claim_name(image_key: str, image_path: str, settings: list[dict]) -> str:
+        # Changed sources or settings get a new claim, so later runs don't skip work done with the old ones
+        try:
+            stat = os.stat(image_path)
+            source = [stat.st_size, stat.st_mtime_ns]
+        except OSError:
+            source = []
+        return hashlib.sha1(json.dumps([image_key, source, settings], sort_keys=True).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _owner(finished: bool = False) -> bytes:
+        return json.dumps(
+            {"host": socket.gethostname(), "pid": os.getpid(), "time": time.time(), "finished": finished}
+        ).encode("utf-8")
+
+    def claim(self, name: str) -> bool:
+        self.folder.mkdir(parents=True, exist_ok=True)
+        path = self.folder.joinpath(name)
+        if create_file_exclusively(path, self._owner()):
+            return True
+        # A claim left unfinished for that long belongs to a process that crashed or lost its connection
+        return (not self.is_finished(name) and remove_if_stale(path, self.stale_after)
+                and create_file_exclusively(path, self._owner()))
+
+    def is_finished(self, name: str) -> bool:
+        try:
+            return json.loads(self.folder.joinpath(name).read_bytes())["finished"]
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def finish(self, name: str) -> None:
+        write_file_atomically(self.folder.joinpath(name), self._owner(finished=True))
+
+    def release(self, name: str) -> None:
+        self.folder.joinpath(name).unlink(missing_ok=True)
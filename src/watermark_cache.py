@@ -0,0 +1,131 @@
+import io
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+
+from PIL import Image
+from PIL.Image import Resampling
+
+
+@dataclass(frozen=True)
+class WatermarkLayout:
+    watermark_size: tuple[int, int]
+    stack_vertically: bool
+    repeats: int
+    offset: int
+    padding_around: int
+    padding_between: int
+
+    @property
+    def overlay_position(self) -> tuple[int, int]:
+        if self.stack_vertically:
+            return self.padding_around, self.offset
+        return self.offset, self.padding_around
+
+    @property
+    def overlay_size(self) -> tuple[int, int]:
+        width, height = self.watermark_size
+        if self.stack_vertically:
+            return width, self.repeats * (height + self.padding_between) - self.padding_between
+        return self.repeats * (width + self.padding_between) - self.padding_between, height
+
+    def tile_positions(self) -> list[tuple[int, int]]:
+        width, height = self.watermark_size
+        if self.stack_vertically:
+            return [(0, repeat * (height + self.padding_between)) for repeat in range(self.repeats)]
+        return [(repeat * (width + self.padding_between), 0) for repeat in range(self.repeats)]
+
+
+class WatermarkCache:
+
+    def __init__(self, max_entries: int = 16, max_overlay_bytes: int = 256 * 1024 * 1024) -> None:
+        self.max_entries = max_entries
+        self.max_overlay_bytes = max_overlay_bytes
+        self._lock = Lock()
+        self._sources: dict[tuple, Image.Image] = {}
+        self._scaled: OrderedDict[tuple, Image.Image] = OrderedDict()
+        self._overlays: OrderedDict[tuple, Image.Image] = OrderedDict()
+        self._overlay_bytes = 0
+
+    @staticmethod
+    def _identity(watermark_path: str) -> tuple:
+        stat = os.stat(watermark_path)
+        return os.path.abspath(watermark_path), stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _image_bytes(image: Image.Image) -> int:
+        return image.width * image.height * len(image.getbands())
+
+    def get_source(self, watermark_path: str) -> Image.Image:
+        identity = self._identity(watermark_path)
+        with self._lock:
+            if identity in self._sources:
+                return self._sources[identity]
+
+        with Image.open(watermark_path) as watermark:
+            watermark.load()
+            source = watermark.copy()
+
+        with self._lock:
+            for stale_identity in [key for key in self._sources if key[0] == identity[0]]:
+                del self._sources[stale_identity]
+            return self._sources.setdefault(identity, source)
+
+    def prime(self, watermark_path: str, watermark_bytes: bytes) -> None:
+        with Image.open(io.BytesIO(watermark_bytes)) as watermark:
+            watermark.load()
+            source = watermark.copy()
+
+        with self._lock:
+            self._sources[self._identity(watermark_path)] = source
+
+    def get_scaled(
+            self, watermark_path: str, size: tuple[int, int], padding_around: int, padding_between: int) -> Image.Image:
+        key = (self._identity(watermark_path), size, padding_around, padding_between)
+        with self._lock:
+            if key in self._scaled:
+                self._scaled.move_to_end(key)
+                return self._scaled[key]
+
+        scaled = self.get_source(watermark_path).resize(size, resample=Resampling.LANCZOS)
+
+        with self._lock:
+            scaled = self._scaled.setdefault(key, scaled)
+            self._scaled.move_to_end(key)
+            while len(self._scaled) > self.max_entries:
+                self._scaled.popitem(last=False)
+        return scaled
+
+    def get_overlay(self, watermark_path: str, layout: WatermarkLayout) -> Image.Image:
+        key = (self._identity(watermark_path), layout)
+        with self._lock:
+            if key in self._overlays:
+                self._overlays.move_to_end(key)
+                return self._overlays[key]
+
+        watermark = self.get_scaled(
+            watermark_path, layout.watermark_size, layout.padding_around, layout.padding_between
+        )
+        # Tiles never overlap, so pasting them without a mask keeps their alpha untouched and the overlay
+        # composites to the same pixels as pasting every tile onto the image one by one.
+        overlay = Image.new(watermark.mode, layout.overlay_size)
+        for position in layout.tile_positions():
+            overlay.paste(watermark, position)
+
+        with self._lock:
+            if key not in self._overlays:
+                self._overlays[key] = overlay
+                self._overlay_bytes += self._image_bytes(overlay)
+            self._overlays.move_to_end(key)
+            while self._overlay_bytes > self.max_overlay_bytes and len(self._overlays) > 1:
+                _, evicted = self._overlays.popitem(last=False)
+                self._overlay_bytes -= self._image_bytes(evicted)
+            return self._overlays[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sources.clear()
+            self._scaled.clear()
+            self._overlays.clear()
+            self._overlay_bytes = 0
@@ -0,0 +1,28 @@
+from dataclasses import dataclass
+
+WATERMARK_JOB_KEYS = ["watermark", "output", "around", "between"]
+
+
+@dataclass(frozen=True)
+class WatermarkJob:
+    watermark_path: str
+    output_folder: str
+    padding_around: int = 0
+    padding_between: int = 0
+
+
+def parse_watermark_job(value: str) -> WatermarkJob:
+    options = {}
+    for item in value.split(","):
+        key, separator, option = item.partition("=")
+        if key not in WATERMARK_JOB_KEYS or not separator:
+            raise ValueError(f"Expected key=value with a key out of {', '.join(WATERMARK_JOB_KEYS)}, got '{item}'")
+        options[key] = option
+    if missing_keys := [key for key in ["watermark", "output"] if not options.get(key)]:
+        raise ValueError(f"Missing {', '.join(missing_keys)} in '{value}'")
+    for key in ["around", "between"]:
+        if not options.get(key, "0").isdigit():
+            raise ValueError(f"Expected the padding {key} watermarks in pixels, got '{options[key]}'")
+    return WatermarkJob(
+        options["watermark"], options["output"], int(options.get("around", 0)), int(options.get("between", 0))
+    )
@@ -0,0 +1,49 @@
+import sys
+import unittest
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath("src")))
+
+from compositing import NUMPY_CHUNK_ROWS, composite_numpy, composite_pillow, numpy  # noqa: E402
+
+
+def create_overlay(size: tuple[int, int]) -> Image.Image:
+    # Every alpha value appears in the overlay, with fully transparent rows between the tiles like in real overlays
+    overlay = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    for x in range(size[0]):
+        draw.line((x, 0, x, size[1] // 3), fill=(255, x % 256, 255 - x % 256, x % 256))
+        draw.line((x, 2 * size[1] // 3, x, size[1] - 1), fill=(x % 256, 0, 128, 255 - x % 256))
+    return overlay
+
+
+def create_image(size: tuple[int, int], mode: str) -> Image.Image:
+    return Image.radial_gradient("L").resize(size).convert(mode)
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class CompositeNumpyTest(unittest.TestCase):
+
+    def assert_same_pixels(self, mode: str, overlay: Image.Image, position: tuple[int, int]) -> None:
+        expected = create_image((400, 3 * NUMPY_CHUNK_ROWS), mode)
+        actual = expected.copy()
+        composite_pillow(expected, overlay, position)
+        composite_numpy(actual, overlay, position)
+        self.assertEqual(expected.mode, actual.mode)
+        self.assertIsNone(ImageChops.difference(expected, actual).getbbox())
+
+    def test_rgb_matches_pillow(self) -> None:
+        self.assert_same_pixels("RGB", create_overlay((256, 2 * NUMPY_CHUNK_ROWS + 7)), (40, 20))
+
+    def test_rgba_matches_pillow(self) -> None:
+        self.assert_same_pixels("RGBA", create_overlay((256, 2 * NUMPY_CHUNK_ROWS + 7)), (40, 20))
+
+    def test_other_modes_fall_back_to_pillow(self) -> None:
+        self.assert_same_pixels("L", create_overlay((256, 100)), (0, 0))
+        self.assert_same_pixels("RGB", create_overlay((256, 100)).convert("LA"), (10, 10))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath("src")))
+
+from encoder_profiles import (  # noqa: E402
+    ENCODER_PROFILES, OUTPUT_FORMATS, encode_image, save_image, supported_output_formats
+)
+
+# Modes photos and scans come in, several of them can't be written by every format
+SOURCE_MODES = ["1", "L", "LA", "I", "I;16", "P", "RGB", "RGBA", "CMYK", "YCbCr"]
+
+
+def create_image(mode: str) -> Image.Image:
+    gradient = Image.radial_gradient("L").resize((64, 48))
+    return Image.merge("LA", (gradient, gradient)).convert("RGBA").convert(mode)
+
+
+class EncoderProfilesTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.output_formats = [output_format for output_format in supported_output_formats()
+                               if OUTPUT_FORMATS[output_format] is not None]
+
+    def test_save_image_writes_every_mode_in_every_format(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for output_format in self.output_formats:
+                for mode in SOURCE_MODES:
+                    with self.subTest(output_format=output_format, mode=mode):
+                        file_name = f"{mode.replace(';', '_')}{OUTPUT_FORMATS[output_format]}"
+                        image_path = str(Path(temp_dir).joinpath(file_name))
+                        save_image(create_image(mode), image_path, "default")
+                        with Image.open(image_path) as image:
+                            self.assertEqual((64, 48), image.size)
+            self.assertEqual([], list(Path(temp_dir).glob(".*")))
+
+    def test_encode_image_encodes_every_mode_with_every_profile(self) -> None:
+        for output_format in self.output_formats:
+            for encoder_profile in ENCODER_PROFILES:
+                for mode in SOURCE_MODES:
+                    with self.subTest(output_format=output_format, encoder_profile=encoder_profile, mode=mode):
+                        image_path = f"image{OUTPUT_FORMATS[output_format]}"
+                        self.assertTrue(encode_image(create_image(mode), image_path, encoder_profile))
+
+    def test_transparency_is_kept_where_the_format_has_alpha(self) -> None:
+        for output_format in self.output_formats:
+            with self.subTest(output_format=output_format):
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    image_path = str(Path(temp_dir).joinpath(f"image{OUTPUT_FORMATS[output_format]}"))
+                    save_image(create_image("LA"), image_path, "default")
+                    with Image.open(image_path) as image:
+                        self.assertEqual(output_format != "jpeg", image.has_transparency_data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath("src")))
+
+from journal import Journal  # noqa: E402
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = Path(self.temp_dir.name).joinpath("journal")
+
+    def read_records(self) -> list[dict]:
+        return [json.loads(line) for line in self.path.read_text(encoding="utf-8").splitlines()]
+
+    def test_missing_journal_loads_nothing(self) -> None:
+        self.assertIsNone(Journal(str(self.path)).load())
+
+    def test_snapshot_and_later_records_are_replayed(self) -> None:
+        journal = Journal(str(self.path))
+        journal.start(["a.jpg", "b.jpg", "c.jpg"], ["z.jpg"], discovering=True, fingerprint="run")
+        journal.append_done("a.jpg")
+        journal.append_todo("d.jpg")
+        journal.finish_discovery()
+        journal.append_done("c.jpg")
+        journal.close()
+
+        self.assertEqual(
+            (["b.jpg", "d.jpg"], ["z.jpg", "a.jpg", "c.jpg"], False, {}, "run"), Journal(str(self.path)).load()
+        )
+
+    def test_truncated_last_record_is_ignored(self) -> None:
+        journal = Journal(str(self.path))
+        journal.start(["a.jpg", "b.jpg"], [])
+        journal.append_done("a.jpg")
+        journal.close()
+        with open(self.path, "a", encoding="utf-8") as journal_file:
+            journal_file.write('{"done": "b.j')
+
+        self.assertEqual((["b.jpg"], ["a.jpg"], False, {}, ""), Journal(str(self.path)).load())
+
+    def test_done_of_unknown_images_is_ignored(self) -> None:
+        journal = Journal(str(self.path))
+        journal.start(["a.jpg"], [])
+        journal.append_done("b.jpg")
+        journal.close()
+
+        self.assertEqual((["a.jpg"], [], False, {}, ""), Journal(str(self.path)).load())
+
+    def test_compacts_after_the_given_number_of_records(self) -> None:
+        journal = Journal(str(self.path), compact_after=3)
+        journal.start([f"{index}.jpg" for index in range(5)], [], fingerprint="run")
+        journal.append_done("0.jpg")
+        journal.append_done("1.jpg")
+        self.assertEqual(3, len(self.read_records()))
+
+        journal.append_done("2.jpg")
+        self.assertEqual(
+            [{"snapshot": {"todo": ["3.jpg", "4.jpg"], "done": ["0.jpg", "1.jpg", "2.jpg"], "jobs": {},
+                           "discovering": False, "fingerprint": "run"}}],
+            self.read_records()
+        )
+        journal.append_done("3.jpg")
+        journal.close()
+        self.assertEqual((["4.jpg"], ["0.jpg", "1.jpg", "2.jpg", "3.jpg"], False, {}, "run"),
+                         Journal(str(self.path)).load())
+
+    def test_partial_jobs_survive_records_and_snapshots(self) -> None:
+        journal = Journal(str(self.path), compact_after=2)
+        journal.start(["a.jpg", "b.jpg"], [], jobs_todo={"a.jpg": [1]})
+        journal.append_todo("c.jpg", [0, 2])
+        journal.close()
+        self.assertEqual(
+            (["a.jpg", "b.jpg", "c.jpg"], [], False, {"a.jpg": [1], "c.jpg": [0, 2]}, ""),
+            Journal(str(self.path)).load()
+        )
+
+        journal = Journal(str(self.path), compact_after=2)
+        journal.start(*Journal(str(self.path)).load()[:4])
+        journal.append_todo("d.jpg", [1])
+        journal.append_done("a.jpg")
+        journal.close()
+        self.assertEqual(["snapshot"], [next(iter(record)) for record in self.read_records()])
+        self.assertEqual(
+            (["b.jpg", "c.jpg", "d.jpg"], ["a.jpg"], False, {"c.jpg": [0, 2], "d.jpg": [1]}, ""),
+            Journal(str(self.path)).load()
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
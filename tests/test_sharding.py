@@ -0,0 +1,143 @@
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath("src")))
+
+from sharding import ClaimFolder, get_image_key, is_in_shard, parse_shard  # noqa: E402
+
+CLI_PATH = Path(__file__).resolve().parent.parent.joinpath("src", "cli.py")
+FINISHED_PATTERN = re.compile(r"Finished, (\d+) of \d+ images marked")
+
+
+class ShardTest(unittest.TestCase):
+
+    def test_parse_shard(self) -> None:
+        self.assertEqual((2, 4), parse_shard("2/4"))
+        for value in ["0/4", "5/4", "2", "2/", "a/4", "-1/4"]:
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    parse_shard(value)
+
+    def test_shards_partition_the_images(self) -> None:
+        image_keys = [f"folder/image_{index:04}.jpg" for index in range(1000)]
+        for count in [1, 2, 3, 7]:
+            with self.subTest(count=count):
+                shards = [{image_key for image_key in image_keys if is_in_shard(image_key, (index, count))}
+                          for index in range(1, count + 1)]
+                self.assertEqual(len(image_keys), sum(map(len, shards)))
+                self.assertEqual(set(image_keys), set().union(*shards))
+                if count > 1:
+                    self.assertTrue(all(shards))
+
+    def test_image_key_is_relative_to_the_source_folder(self) -> None:
+        self.assertEqual("b/c.jpg", get_image_key("/mnt/share/a/b/c.jpg", "/mnt/share/a"))
+        self.assertEqual(get_image_key("/elsewhere/c.jpg", None), get_image_key("/elsewhere/c.jpg", "/mnt/share/a"))
+
+
+class ClaimFolderTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.folder = Path(self.temp_dir.name).joinpath("claims")
+
+    def age_claim(self, name: str, seconds: float) -> None:
+        claimed_at = time.time() - seconds
+        os.utime(self.folder.joinpath(name), (claimed_at, claimed_at))
+
+    def test_claim_is_exclusive(self) -> None:
+        claims = [ClaimFolder(self.folder), ClaimFolder(self.folder)]
+        self.assertTrue(claims[0].claim("image"))
+        self.assertFalse(claims[1].claim("image"))
+        self.assertFalse(claims[0].claim("image"))
+        self.assertTrue(claims[1].claim("other image"))
+
+    def test_released_claim_can_be_claimed_again(self) -> None:
+        claims = ClaimFolder(self.folder)
+        self.assertTrue(claims.claim("image"))
+        claims.release("image")
+        self.assertTrue(claims.claim("image"))
+
+    def test_stale_claim_is_taken_over(self) -> None:
+        self.assertTrue(ClaimFolder(self.folder).claim("image"))
+        self.age_claim("image", 60)
+        self.assertFalse(ClaimFolder(self.folder, stale_after=120).claim("image"))
+        self.assertTrue(ClaimFolder(self.folder, stale_after=30).claim("image"))
+        self.assertFalse(ClaimFolder(self.folder, stale_after=30).claim("image"))
+
+    def test_finished_claim_is_never_taken_over(self) -> None:
+        claims = ClaimFolder(self.folder, stale_after=30)
+        self.assertTrue(claims.claim("image"))
+        claims.finish("image")
+        self.age_claim("image", 60)
+        self.assertTrue(claims.is_finished("image"))
+        self.assertFalse(claims.claim("image"))
+
+    def test_claim_name_changes_with_the_settings(self) -> None:
+        image_path = str(Path(self.temp_dir.name).joinpath("image.jpg"))
+        Path(image_path).write_bytes(b"image")
+        name = ClaimFolder.get_claim_name("image.jpg", image_path, [{"format": "jpeg"}])
+        self.assertEqual(name, ClaimFolder.get_claim_name("image.jpg", image_path, [{"format": "jpeg"}]))
+        self.assertNotEqual(name, ClaimFolder.get_claim_name("image.jpg", image_path, [{"format": "png"}]))
+
+
+class SeveralProcessesTest(unittest.TestCase):
+    PROCESSES = 3
+    IMAGES = 24
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        temp_path = Path(self.temp_dir.name)
+        self.source_folder = temp_path.joinpath("source")
+        self.source_folder.mkdir()
+        for index in range(self.IMAGES):
+            Image.new("RGB", (160, 120), (index * 10, 100, 200)).save(self.source_folder.joinpath(f"{index:02}.jpg"))
+        self.watermark_path = temp_path.joinpath("watermark.png")
+        Image.new("RGBA", (40, 20), (255, 255, 255, 128)).save(self.watermark_path)
+
+    def run_processes(self, output_folder: Path, mode_arguments: list[list[str]]) -> list[int]:
+        running = [subprocess.Popen(
+            [sys.executable, str(CLI_PATH), str(self.source_folder), "-w", str(self.watermark_path), "-o",
+             str(output_folder), "-j", "2", "--interval", "3600"] + arguments,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        ) for arguments in mode_arguments]
+        outputs = [process.communicate(timeout=120) for process in running]
+        for process, (_, errors) in zip(running, outputs):
+            self.assertEqual(0, process.returncode, errors)
+        return [int(match.group(1)) for output, _ in outputs for match in FINISHED_PATTERN.finditer(output)]
+
+    def assert_marked_once(self, output_folder: Path, marked_per_process: list[int]) -> None:
+        marked_images = sorted(path.name for path in output_folder.iterdir() if not path.name.startswith("."))
+        self.assertEqual(sorted(path.name for path in self.source_folder.iterdir()), marked_images)
+        self.assertEqual(self.PROCESSES, len(marked_per_process))
+        self.assertEqual(self.IMAGES, sum(marked_per_process))
+
+    def test_shards_mark_every_image_once(self) -> None:
+        output_folder = Path(self.temp_dir.name).joinpath("output")
+        marked_per_process = self.run_processes(
+            output_folder, [["--shard", f"{index}/{self.PROCESSES}"] for index in range(1, self.PROCESSES + 1)]
+        )
+        self.assert_marked_once(output_folder, marked_per_process)
+
+    def test_work_stealing_marks_every_image_once(self) -> None:
+        output_folder = Path(self.temp_dir.name).joinpath("output")
+        marked_per_process = self.run_processes(output_folder, [["--work-stealing"]] * self.PROCESSES)
+        self.assert_marked_once(output_folder, marked_per_process)
+
+        # Running again finds every claim finished and marks nothing
+        self.assertEqual([0], self.run_processes(output_folder, [["--work-stealing"]]))
+
+
+if __name__ == "__main__":
+    unittest.main()